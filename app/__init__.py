@@ -2,9 +2,10 @@ from flask import Flask
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
+from .replicas import RoutingSession
 
 # Initialize the Database
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 # Flask Login To do
 login_manager = LoginManager()
@@ -19,16 +20,46 @@ def create_app():
     login_manager.init_app(app)
     login_manager.login_view = "main.login"
 
+    from . import replicas
+    replicas.init_app(app)
+
+    from .instrumentation import metrics
+    metrics.init_app(app)
+
     from .models import Users
+    from .user_cache import user_cache
+    user_cache.init_app(app)
 
     @login_manager.user_loader
     def load_user(user_id):
-        return Users.query.get(user_id)
+        return user_cache.load(Users, user_id)
+
+    from .fragments import fragment_cache
+    fragment_cache.init_app(app)
+
+    from .analytics import analytics_cache
+    analytics_cache.init_app(app)
+
+    from .avatars import avatar_url, is_processed
+    app.add_template_global(avatar_url)
+    app.add_template_global(is_processed, 'is_processed_avatar')
 
     from .routes import main
     app.register_blueprint(main)
 
-    with app.app_context():
-        db.create_all()
+    from . import assets
+    assets.init_app(app)
+
+    from .commands import rollups_cli, balances_cli, indexes_cli, forecast_cli, users_cli, assets_cli, \
+        archive_cli, batch_cli, import_transactions_command
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(balances_cli)
+    app.cli.add_command(indexes_cli)
+    app.cli.add_command(forecast_cli)
+    app.cli.add_command(users_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(archive_cli)
+    app.cli.add_command(batch_cli)
+    app.cli.add_command(import_transactions_command)
 
     return app
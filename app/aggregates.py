@@ -0,0 +1,167 @@
+from datetime import datetime
+from sqlalchemy import case, extract, func, union_all
+from . import db
+from .models import Users, Transactions, ArchivedTransactions, MonthlySummary
+from .recurring import recurring_projection
+
+
+class MonthlyTotals:
+    """Income and expense per calendar month (index 0 is January)."""
+
+    def __init__(self):
+        self.income = [0] * 12
+        self.expense = [0] * 12
+        self.projected_balance = None
+
+    @property
+    def total(self):
+        return [income - expense for income, expense in zip(self.income, self.expense)]
+
+    @property
+    def income_sum(self):
+        return sum(self.income)
+
+    @property
+    def expense_sum(self):
+        return sum(self.expense)
+
+    @property
+    def overspending(self):
+        return any(expense > income for income, expense in zip(self.income, self.expense))
+
+    def add(self, month, trans_type, amount):
+        if trans_type.lower() == 'income':
+            self.income[month - 1] += amount
+        elif trans_type.lower() == 'expense':
+            self.expense[month - 1] += amount
+
+
+def monthly_totals(user_id, year=None):
+    # Reads the MonthlySummary rollup: at most 12 rows per type and year, via the primary key
+    query = db.session.query(MonthlySummary.month, MonthlySummary.trans_type, MonthlySummary.amount) \
+        .filter(MonthlySummary.user_id == user_id)
+    if year is not None:
+        query = query.filter(MonthlySummary.year == year)
+
+    totals = MonthlyTotals()
+    for month, trans_type, amount in query:
+        totals.add(month, trans_type, int(amount))
+    return totals
+
+
+def dashboard_totals(user, year=None):
+    """Stored monthly totals plus the projected occurrences of the user's recurring transactions."""
+    totals = monthly_totals(user.id, year)
+    projection = recurring_projection(user.id, user.data_version)
+    for (projected_year, month, trans_type), amount in projection.monthly.items():
+        if year is None or projected_year == year:
+            totals.add(month, trans_type, amount)
+    totals.projected_balance = user.balance + projection.balance_delta
+    return totals
+
+
+def dashboard_data(user, totals=None):
+    totals = totals or dashboard_totals(user, datetime.now().year)
+    return {
+        'balance': user.balance,
+        'projected_balance': totals.projected_balance,
+        'income_data': totals.income,
+        'expense_data': totals.expense,
+        'income_sum': totals.income_sum,
+        'expense_sum': totals.expense_sum,
+    }
+
+
+def all_transactions(user_id=None, year=None):
+    """Live and archived transactions as one subquery; the balance and the rollups cover both."""
+    selects = []
+    for model in (Transactions, ArchivedTransactions):
+        select = db.select(model.user_id, model.date_added, model.trans_type, model.amount)
+        # Filters go inside the union so each table's user index can serve them
+        if user_id is not None:
+            select = select.where(model.user_id == user_id)
+        if year is not None:
+            select = select.where(model.date_added >= datetime(year, 1, 1), model.date_added < datetime(year + 1, 1, 1))
+        selects.append(select)
+    return union_all(*selects).subquery()
+
+
+def grouped_transactions_query(user_id=None, year=None):
+    # One grouped query over the raw rows, used to rebuild and verify the rollup.
+    # extract() compiles to EXTRACT on MySQL/PostgreSQL and strftime on SQLite.
+    rows = all_transactions(user_id, year)
+    year_col = extract('year', rows.c.date_added)
+    month_col = extract('month', rows.c.date_added)
+    return db.session.query(rows.c.user_id, year_col, month_col, rows.c.trans_type,
+                            func.sum(rows.c.amount), func.count()) \
+        .group_by(rows.c.user_id, year_col, month_col, rows.c.trans_type)
+
+
+def grouped_transactions(user_id=None, year=None):
+    return {(uid, int(y), int(m), trans_type): (int(amount or 0), int(count))
+            for uid, y, m, trans_type, amount, count in grouped_transactions_query(user_id, year)}
+
+
+def summary_rows(user_id=None):
+    query = db.session.query(MonthlySummary)
+    if user_id is not None:
+        query = query.filter(MonthlySummary.user_id == user_id)
+    return {(row.user_id, row.year, row.month, row.trans_type): (int(row.amount), row.txn_count)
+            for row in query}
+
+
+def rebuild_monthly_summary(user_id=None):
+    expected = grouped_transactions(user_id)
+
+    delete = db.delete(MonthlySummary)
+    if user_id is not None:
+        delete = delete.where(MonthlySummary.user_id == user_id)
+    db.session.execute(delete)
+    if expected:
+        db.session.execute(db.insert(MonthlySummary), [
+            dict(user_id=uid, year=year, month=month, trans_type=trans_type, amount=amount, txn_count=count)
+            for (uid, year, month, trans_type), (amount, count) in expected.items()
+        ])
+    db.session.commit()
+    return len(expected)
+
+
+def verify_monthly_summary(user_id=None):
+    """Return {key: (expected, stored)} for every rollup row that disagrees with the raw transactions."""
+    expected = grouped_transactions(user_id)
+    # Rows that were decremented to zero are harmless
+    stored = {key: value for key, value in summary_rows(user_id).items() if value != (0, 0)}
+
+    return {key: (expected.get(key), stored.get(key))
+            for key in expected.keys() | stored.keys()
+            if expected.get(key) != stored.get(key)}
+
+
+def balance_drift(user_id=None):
+    """Return {user_id: (stored, expected)} for every user whose balance disagrees with the full sum."""
+    rows = all_transactions(user_id)
+    signed = case((rows.c.trans_type == 'Income', rows.c.amount),
+                  (rows.c.trans_type == 'Expense', -rows.c.amount), else_=0)
+    sums = db.session.query(rows.c.user_id.label('user_id'), func.sum(signed).label('expected')) \
+        .group_by(rows.c.user_id).subquery()
+    expected = func.coalesce(sums.c.expected, 0)
+
+    query = db.session.query(Users.id, Users.balance, expected) \
+        .outerjoin(sums, sums.c.user_id == Users.id) \
+        .filter(Users.balance != expected)
+    if user_id is not None:
+        query = query.filter(Users.id == user_id)
+
+    return {uid: (stored, int(total)) for uid, stored, total in query}
+
+
+def reconcile_balances(user_id=None):
+    drift = balance_drift(user_id)
+    for uid, (stored, expected) in drift.items():
+        # Repair by delta so writes that land while this runs are not overwritten
+        db.session.execute(db.update(Users).where(Users.id == uid)
+                           .values(balance=Users.balance + (expected - stored)))
+    db.session.commit()
+    for uid in drift:
+        Users.data_changed(uid)
+    return drift
@@ -0,0 +1,215 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+import numpy as np
+from . import db
+from .forms import CATEGORY_CHOICES
+from .models import Transactions, ArchivedTransactions
+
+TYPES = ('Income', 'Expense')
+CATEGORIES = [value for value, _ in CATEGORY_CHOICES if value is not None] + ['Other']
+CATEGORY_CODES = {category: code for code, category in enumerate(CATEGORIES)}
+OTHER_TYPE = len(TYPES)
+COLUMNS = (('amount', np.int64), ('type', np.int8), ('category', np.int8), ('day', np.int32),
+           ('month', np.int32), ('key', np.int64), ('live', np.bool_))
+
+
+def type_code(trans_type):
+    return TYPES.index(trans_type) if trans_type in TYPES else OTHER_TYPE
+
+
+def to_days(dates):
+    """datetime objects to days since 1970-01-01."""
+    return np.array(dates, dtype='datetime64[us]').astype('datetime64[D]').astype(np.int64)
+
+
+def to_months(days):
+    """Days since 1970 to months since January 1970."""
+    return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+
+class UserColumns:
+    """One user's transactions as parallel arrays: amount, type code, category code, epoch day and month.
+
+    Rows are keyed by hash(id) so single writes can be applied in place;
+    deleted rows are masked out through `live` until the next compaction.
+    """
+
+    def __init__(self, version, rows=()):
+        self.version = version
+        self.size = 0
+        self.dead = 0
+        for name, dtype in COLUMNS:
+            setattr(self, name, np.zeros(0, dtype=dtype))
+        self.append(rows)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name, _ in COLUMNS)
+
+    def append(self, rows):
+        """rows are (id, amount, trans_type, category, date_added) tuples."""
+        if not rows:
+            return
+        ids, amounts, types, categories, dates = zip(*rows)
+        count = len(ids)
+        if self.size + count > len(self.amount):
+            capacity = max(self.size + count, 2 * len(self.amount), 64)
+            for name, _ in COLUMNS:
+                column = getattr(self, name)
+                grown = np.zeros(capacity, dtype=column.dtype)
+                grown[:self.size] = column[:self.size]
+                setattr(self, name, grown)
+
+        days = to_days(dates)
+        end = self.size + count
+        self.amount[self.size:end] = amounts
+        self.type[self.size:end] = [type_code(t) for t in types]
+        self.category[self.size:end] = [CATEGORY_CODES.get(c, len(CATEGORIES) - 1) for c in categories]
+        self.day[self.size:end] = days
+        self.month[self.size:end] = to_months(days)
+        self.key[self.size:end] = [hash(i) for i in ids]
+        self.live[self.size:end] = True
+        self.size = end
+
+    def remove(self, ids):
+        keys, live = self.key[:self.size], self.live[:self.size]
+        for transaction_id in ids:
+            matches = np.flatnonzero((keys == hash(transaction_id)) & live)
+            self.live[matches] = False
+            self.dead += len(matches)
+        if self.dead * 2 > self.size:
+            self.compact()
+
+    def compact(self):
+        keep = self.live[:self.size]
+        for name, _ in COLUMNS:
+            setattr(self, name, getattr(self, name)[:self.size][keep].copy())
+        self.size = len(self.amount)
+        self.dead = 0
+
+    def select(self, start=None, end=None, trans_type=None, category=None):
+        """Boolean mask of the live rows in [start, end) epoch days matching the filters."""
+        mask = self.live[:self.size].copy()
+        if start is not None:
+            mask &= self.day[:self.size] >= start
+        if end is not None:
+            mask &= self.day[:self.size] < end
+        if trans_type is not None:
+            mask &= self.type[:self.size] == type_code(trans_type)
+        if category is not None:
+            mask &= self.category[:self.size] == CATEGORY_CODES.get(category, len(CATEGORIES) - 1)
+        return mask
+
+    def totals(self, mask):
+        amount, types = self.amount[:self.size][mask], self.type[:self.size][mask]
+        income, expense = np.bincount(types, weights=amount, minlength=OTHER_TYPE + 1)[:2]
+        return {'income': int(income), 'expense': int(expense), 'net': int(income - expense),
+                'count': int(mask.sum())}
+
+    def by_category(self, mask):
+        # One bincount over (category, type) pairs
+        codes = self.category[:self.size][mask].astype(np.int64) * (OTHER_TYPE + 1) + self.type[:self.size][mask]
+        sums = np.bincount(codes, weights=self.amount[:self.size][mask],
+                           minlength=len(CATEGORIES) * (OTHER_TYPE + 1)).reshape(len(CATEGORIES), OTHER_TYPE + 1)
+        return {category: {'income': int(sums[code, 0]), 'expense': int(sums[code, 1])}
+                for code, category in enumerate(CATEGORIES) if sums[code, :2].any()}
+
+    def by_month(self, years, mask):
+        """{year: {'income': [12 amounts], 'expense': [12 amounts]}} for each requested year."""
+        first = (min(years) - 1970) * 12
+        span = (max(years) - min(years) + 1) * 12
+        month = self.month[:self.size]
+        mask = mask & (month >= first) & (month < first + span)
+        codes = (month[mask] - first).astype(np.int64) * (OTHER_TYPE + 1) + self.type[:self.size][mask]
+        sums = np.bincount(codes, weights=self.amount[:self.size][mask],
+                           minlength=span * (OTHER_TYPE + 1)).reshape(span, OTHER_TYPE + 1)
+        result = {}
+        for year in years:
+            offset = (year - min(years)) * 12
+            result[year] = {'income': sums[offset:offset + 12, 0].astype(np.int64).tolist(),
+                            'expense': sums[offset:offset + 12, 1].astype(np.int64).tolist()}
+        return result
+
+
+class AnalyticsCache:
+    """Per-user UserColumns, LRU-evicted once their arrays exceed max_bytes in total.
+
+    Like the search index, each entry records the data_version it reflects:
+    transaction writes, batches and imports apply their change in place
+    through Transactions.update_caches, and any other change (writes in
+    another worker, archiving) makes the next read rebuild it.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+
+    def init_app(self, app):
+        self.max_bytes = app.config.get('ANALYTICS_CACHE_BYTES', self.max_bytes)
+
+    @staticmethod
+    def _load(user_id):
+        rows = []
+        # Archived transactions are history too
+        for model in (Transactions, ArchivedTransactions):
+            rows += db.session.query(model.id, model.amount, model.trans_type, model.category, model.date_added) \
+                .filter(model.user_id == user_id).all()
+        return rows
+
+    def _evict(self):
+        total = sum(columns.nbytes for columns in self._users.values())
+        while total > self.max_bytes and len(self._users) > 1:
+            _, columns = self._users.popitem(last=False)
+            total -= columns.nbytes
+
+    def get(self, user_id, version):
+        with self._lock:
+            columns = self._users.get(user_id)
+            if columns is not None and columns.version == version:
+                self._users.move_to_end(user_id)
+                return columns
+        columns = UserColumns(version, self._load(user_id))
+        with self._lock:
+            self._users[user_id] = columns
+            self._users.move_to_end(user_id)
+            self._evict()
+        return columns
+
+    def read(self, user_id, version, reader):
+        # Readers run under the lock so a concurrent write can't resize the arrays mid-query
+        columns = self.get(user_id, version)
+        with self._lock:
+            return reader(columns)
+
+    def apply(self, user_id, old_version, new_version, added=(), removed=()):
+        """Apply one write (CachedRow tuples added, ids removed) if the user's entry is current."""
+        with self._lock:
+            columns = self._users.get(user_id)
+            if columns is None or columns.version != old_version:
+                return
+            columns.remove(removed)
+            columns.append([(row.id, row.amount, row.trans_type, row.category, row.date_added) for row in added])
+            columns.version = new_version
+            self._evict()
+
+
+analytics_cache = AnalyticsCache()
+
+
+def analytics(user, start=None, end=None, category=None, trans_type=None, years=None):
+    """Totals and category breakdown for [start, end] (inclusive dates) plus monthly totals for `years`."""
+    start_day = int(to_days([start])[0]) if start else None
+    end_day = int(to_days([end])[0]) + 1 if end else None
+    years = sorted(set(years or [datetime.now().year - 1, datetime.now().year]))
+
+    def reader(columns):
+        mask = columns.select(start_day, end_day, trans_type, category)
+        return {
+            'range': dict(columns.totals(mask), start=start.date().isoformat() if start else None,
+                          end=end.date().isoformat() if end else None),
+            'categories': columns.by_category(mask),
+            'years': columns.by_month(years, columns.select(trans_type=trans_type, category=category)),
+        }
+    return analytics_cache.read(user.id, user.data_version, reader)
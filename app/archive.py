@@ -0,0 +1,83 @@
+from datetime import date, datetime
+from . import db
+from .forecast import HISTORY_MONTHS
+from .forms import DURATION_CHOICES
+from .models import Users, Transactions, ArchivedTransactions
+
+ARCHIVE_COLUMNS = ('id', 'amount', 'trans_type', 'category', 'transaction_frequency', 'description', 'duration',
+                   'date_added', 'user_id')
+BATCH_SIZE = 2000
+# The forecast reads its last few months of one-off history from the live table only; recurring rules are
+# read from both tables, but staying live for their longest duration keeps most of them from ever moving
+MIN_MONTHS = max(max(value for value, _ in DURATION_CHOICES if value is not None), HISTORY_MONTHS) + 1
+
+
+def cutoff(months, today=None):
+    """Start of the month `months` months before today's; older transactions are archived."""
+    if months < MIN_MONTHS:
+        raise ValueError(f"Transactions must stay live for at least {MIN_MONTHS} months")
+    today = today or date.today()
+    month = today.year * 12 + today.month - 1 - months
+    return datetime(month // 12, month % 12 + 1, 1)
+
+
+def archive_batch(user_id, before, batch_size=BATCH_SIZE):
+    """Move up to batch_size of a user's transactions older than `before` into the archive, in one transaction.
+
+    Returns the number moved. The copy and the delete commit together, so an
+    interrupted job leaves every row in exactly one table and can simply be rerun.
+    The user's data_version is bumped with them, so no worker keeps serving
+    caches keyed on a version that still had the rows in the live table.
+    """
+    ids = [row[0] for row in db.session.query(Transactions.id)
+           .filter(Transactions.user_id == user_id, Transactions.date_added < before)
+           .order_by(Transactions.date_added, Transactions.id)
+           .limit(batch_size)]
+    if not ids:
+        return 0
+    columns = [getattr(Transactions, name) for name in ARCHIVE_COLUMNS]
+    db.session.execute(db.insert(ArchivedTransactions).from_select(
+        ARCHIVE_COLUMNS, db.select(*columns).where(Transactions.id.in_(ids))))
+    db.session.execute(db.delete(Transactions).where(Transactions.id.in_(ids)))
+    db.session.execute(db.update(Users).where(Users.id == user_id)
+                       .values(data_version=Users.data_version + 1))
+    db.session.commit()
+    Users.data_changed(user_id)
+    return len(ids)
+
+
+def archive_transactions(months, batch_size=BATCH_SIZE, user_batch=500, progress=None):
+    """Archive every user's transactions older than `months` months. Returns the number moved.
+
+    What users see is unchanged: the balance and MonthlySummary already
+    account for the rows, and search, export, analytics and the recurring
+    projections and forecasts read both tables. Users are walked in id order and each is drained through
+    ix_transactions_user_date, so rerunning after an interruption skips
+    finished users quickly.
+    """
+    before = cutoff(months)
+    moved = 0
+    last_id = ''
+    while True:
+        user_ids = [row[0] for row in db.session.query(Users.id).filter(Users.id > last_id)
+                    .order_by(Users.id).limit(user_batch)]
+        if not user_ids:
+            return moved
+        last_id = user_ids[-1]
+        for user_id in user_ids:
+            while True:
+                count = archive_batch(user_id, before, batch_size)
+                moved += count
+                if progress and count:
+                    progress(user_id, count)
+                if count < batch_size:
+                    break
+
+
+def archive_status():
+    """Live and archived row counts, and the oldest live transaction date."""
+    return {
+        'live': db.session.query(db.func.count(Transactions.id)).scalar(),
+        'archived': db.session.query(db.func.count(ArchivedTransactions.id)).scalar(),
+        'oldest_live': db.session.query(db.func.min(Transactions.date_added)).scalar(),
+    }
@@ -0,0 +1,131 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+from flask import request, send_from_directory
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+# User uploads live under static/images/profile and are not part of the build
+SKIP = ('dist', 'images/profile')
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map')
+CSS_URL = re.compile(r'url\((["\']?)([^"\')]+)\1\)')
+# Fingerprinted files never change, so browsers may keep them for a year without revalidating
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def fingerprint(path, data):
+    root, ext = posixpath.splitext(path)
+    return f"{root}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+
+
+def source_files(static_folder):
+    for directory, dirs, files in os.walk(static_folder):
+        relative = posixpath.relpath(directory.replace(os.sep, '/'), static_folder.replace(os.sep, '/'))
+        relative = '' if relative == '.' else relative
+        dirs[:] = [d for d in dirs if posixpath.join(relative, d) not in SKIP]
+        for name in files:
+            if not name.startswith('.'):
+                yield posixpath.join(relative, name)
+
+
+def rewrite_css(path, text, manifest):
+    """Point url() references at other assets to their fingerprinted copies."""
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(('data:', 'http:', 'https:', '//', '#')):
+            return match.group(0)
+        target, _, fragment = url.partition('#')
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(path), target.partition('?')[0]))
+        if target not in manifest:
+            return match.group(0)
+        # The fingerprinted stylesheet sits in the same directory under dist/ as its source
+        url = posixpath.relpath(manifest[target], posixpath.join(DIST, posixpath.dirname(path)))
+        return f"url({quote}{url}{'#' + fragment if fragment else ''}{quote})"
+    return CSS_URL.sub(replace, text)
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+def build(static_folder):
+    """Write fingerprinted copies of the static files, with .gz and .br siblings, and their manifest.
+
+    Returns the manifest, {source path: fingerprinted path} relative to the
+    static folder. Earlier builds are left in place so pages rendered before
+    a deploy can still load their assets.
+    """
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+
+    manifest = {}
+    # Stylesheets go last so the url() references they contain can be rewritten first
+    for path in sorted(source_files(static_folder), key=lambda p: (p.endswith('.css'), p)):
+        with open(os.path.join(static_folder, path), 'rb') as f:
+            data = f.read()
+        if path.endswith('.css'):
+            data = rewrite_css(path, data.decode('utf-8'), manifest).encode('utf-8')
+        manifest[path] = posixpath.join(DIST, fingerprint(path, data))
+
+        target = os.path.join(static_folder, manifest[path])
+        write(target, data)
+        if path.endswith(COMPRESSIBLE):
+            write(target + '.gz', gzip.compress(data, 9, mtime=0))
+            if brotli is not None:
+                write(target + '.br', brotli.compress(data, quality=11))
+
+    write(os.path.join(static_folder, DIST, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def init_app(app):
+    """Use the fingerprinted assets when a build exists; without one, static files are served as before."""
+    manifest = load_manifest(app.static_folder)
+    if not manifest:
+        return
+    fingerprinted = set(manifest.values())
+    send_static_file = app.view_functions['static']
+
+    @app.url_defaults
+    def fingerprint_static(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = manifest.get(values['filename'].lstrip('/'), values['filename'])
+
+    def static(filename):
+        if filename not in fingerprinted:
+            return send_static_file(filename=filename)
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encoding = None
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings[candidate] and \
+                    os.path.exists(os.path.join(app.static_folder, filename + suffix)):
+                encoding = candidate
+                filename += suffix
+                break
+
+        response = send_from_directory(app.static_folder, filename, mimetype=mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = IMMUTABLE
+        return response
+
+    app.view_functions['static'] = static
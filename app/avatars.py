@@ -0,0 +1,120 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from threading import Lock
+from flask import url_for
+from . import db
+
+DEFAULT_PIC = "profile/profile-user.png"
+SIZES = (64, 128, 256)
+FORMATS = (('webp', 'WEBP'), ('jpg', 'JPEG'))
+MAX_PIXELS = 40_000_000
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_executor(app):
+    # Created on first use so each gunicorn worker gets its own threads after forking
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=app.config.get('AVATAR_WORKERS', 2),
+                                           thread_name_prefix='avatars')
+        return _executor
+
+
+def is_processed(profile_pic):
+    # Processed avatars are stored as a content-hash key without an extension
+    return bool(profile_pic) and '.' not in os.path.basename(profile_pic)
+
+
+def avatar_url(profile_pic, size=64, ext='jpg'):
+    if not is_processed(profile_pic):
+        return url_for('static', filename='images/' + (profile_pic or DEFAULT_PIC))
+    size = min((s for s in SIZES if s >= size), default=SIZES[-1])
+    return url_for('static', filename=f"images/{profile_pic}_{size}.{ext}")
+
+
+def make_thumbnails(data, upload_folder):
+    """Validate an uploaded image and write its square thumbnails; returns the avatar key.
+
+    The thumbnails are re-encoded from pixel data only, which drops EXIF, GPS
+    and any other metadata from the upload.
+    """
+    # Pillow is imported on first upload, not at worker startup
+    from PIL import Image, ImageOps
+
+    key = "profile/" + hashlib.sha256(data).hexdigest()[:24]
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+    with Image.open(BytesIO(data)) as image:
+        image.verify()
+
+    with Image.open(BytesIO(data)) as image:
+        # Apply the EXIF orientation before the metadata is dropped
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for size in SIZES:
+            thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+            for ext, image_format in FORMATS:
+                path = os.path.join(upload_folder, f"{key}_{size}.{ext}")
+                if os.path.exists(path):
+                    continue
+                thumbnail.save(path + '.tmp', image_format, quality=85)
+                os.replace(path + '.tmp', path)
+    return key
+
+
+def delete_avatar(profile_pic, upload_folder):
+    """Remove the thumbnails of a processed avatar, or the file of an old-style upload."""
+    if is_processed(profile_pic):
+        paths = [f"{profile_pic}_{size}.{ext}" for size in SIZES for ext, _ in FORMATS]
+    elif profile_pic != DEFAULT_PIC and profile_pic.startswith('profile/'):
+        paths = [profile_pic]
+    else:
+        return
+    for path in paths:
+        try:
+            os.remove(os.path.join(upload_folder, path))
+        except FileNotFoundError:
+            pass
+
+
+def release_avatar(profile_pic, upload_folder):
+    """Delete an avatar's files once no user has it any more."""
+    from .models import Users
+
+    # Content-hashed pictures can be shared by several accounts
+    if profile_pic and not db.session.query(Users.id).filter(Users.profile_pic == profile_pic).first():
+        delete_avatar(profile_pic, upload_folder)
+
+
+def process_avatar(app, user_id, data):
+    from PIL import Image, UnidentifiedImageError
+    from .models import Users
+
+    with app.app_context():
+        try:
+            key = make_thumbnails(data, app.config['UPLOAD_FOLDER'])
+            previous = db.session.query(Users.profile_pic).filter(Users.id == user_id).scalar()
+            db.session.execute(db.update(Users).where(Users.id == user_id).values(profile_pic=key))
+            db.session.commit()
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+            app.logger.warning("Rejected profile picture for user %s: %s", user_id, e)
+            return
+        except Exception:
+            # Nobody waits on the Future, so this is the only place the error can surface
+            db.session.rollback()
+            app.logger.exception("Could not process the profile picture of user %s", user_id)
+            return
+        Users.data_changed(user_id)
+        if previous != key:
+            release_avatar(previous, app.config['UPLOAD_FOLDER'])
+
+
+def submit_avatar(app, user_id, upload):
+    """Queue an uploaded profile picture for processing; the user keeps their current picture until it is done."""
+    data = upload.read()
+    if len(data) > app.config.get('AVATAR_MAX_BYTES', 10 * 1024 * 1024):
+        raise ValueError("Profile picture is too large")
+    return get_executor(app).submit(process_avatar, app, user_id, data)
@@ -0,0 +1,195 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from . import db
+from .importer import validate_row
+from .models import Users, Transactions, ArchivedTransactions, IdempotencyKey, RollupDelta
+
+OPERATIONS = ('create', 'update', 'delete')
+KEY_LENGTH = IdempotencyKey.key.type.length
+MAX_OPERATIONS = 500
+CHANGED = "The transaction was changed or deleted by another request"
+
+
+class BatchInProgress(Exception):
+    """Another request is applying some of the same idempotency keys; the client should retry."""
+
+
+def fingerprint(operation):
+    return hashlib.sha256(json.dumps(operation, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+def as_row(fields):
+    """JSON transaction fields as the strings validate_row reads from a CSV row."""
+    return {name: '' if value is None else str(value) for name, value in fields.items()}
+
+
+def current_row(transaction):
+    return {
+        'amount': str(transaction.amount),
+        'type': transaction.trans_type,
+        'category': transaction.category,
+        'frequency': transaction.transaction_frequency,
+        'duration': str(transaction.duration),
+        'description': transaction.description or '',
+        'date': transaction.date_added.isoformat() if transaction.date_added else '',
+    }
+
+
+def check_operation(operation, seen):
+    """Return the error message of a malformed operation, or None."""
+    if not isinstance(operation, dict):
+        return "Each operation must be an object"
+    key = operation.get('key')
+    if not isinstance(key, str) or not 0 < len(key) <= KEY_LENGTH:
+        return f"key must be a string of 1 to {KEY_LENGTH} characters"
+    if key in seen:
+        return f"Duplicate key {key!r} in this batch"
+    seen.add(key)
+    if operation.get('op') not in OPERATIONS:
+        return f"op must be one of {', '.join(OPERATIONS)}"
+    if operation['op'] != 'create' and not isinstance(operation.get('id'), str):
+        return f"{operation['op']} needs the transaction id"
+    if operation['op'] != 'delete' and not isinstance(operation.get('transaction'), dict):
+        return f"{operation['op']} needs a transaction object"
+    return None
+
+
+def missing_target(transaction_id, user_id):
+    if db.session.query(ArchivedTransactions.id).filter(ArchivedTransactions.id == transaction_id,
+                                                        ArchivedTransactions.user_id == user_id).first():
+        return 409, "Archived transactions can no longer be changed"
+    return 404, "Transaction not found"
+
+
+def apply_batch(user, operations, max_operations=MAX_OPERATIONS):
+    """Apply a client's create, update and delete operations in one database transaction.
+
+    Each operation is {"op": "create", "key": ..., "transaction": {...}},
+    {"op": "update", "key": ..., "id": ..., "transaction": {...}} or
+    {"op": "delete", "key": ..., "id": ...}. Transaction fields are those of
+    the CSV import (amount, type, category, frequency, duration, description,
+    date); an update only needs the fields it changes.
+
+    Returns one result per operation, in order, with its key and an HTTP-style
+    status: 201 or 200 with the transaction, or 204, when it was applied, and
+    400, 404 or 409 with an error when it was not. A rejected operation does
+    not stop the others. A key that was applied before returns its stored
+    result with replayed=True instead of being applied twice; reusing it for
+    a different operation is a 409. The balance and rollups get one update
+    for the whole batch. Raises ValueError if operations is not a list of at
+    most max_operations.
+    """
+    if not isinstance(operations, list):
+        raise ValueError("operations must be a list")
+    if len(operations) > max_operations:
+        raise ValueError(f"At most {max_operations} operations per batch")
+
+    results = [None] * len(operations)
+    seen = set()
+    for index, operation in enumerate(operations):
+        error = check_operation(operation, seen)
+        if error:
+            key = operation.get('key') if isinstance(operation, dict) else None
+            results[index] = {'key': key, 'status': 400, 'error': error}
+
+    # One query each for the keys already applied and for the transactions to change
+    pending = [index for index, result in enumerate(results) if result is None]
+    hashes = {index: fingerprint(operations[index]) for index in pending}
+    stored = {record.key: record for record in IdempotencyKey.query.filter(
+        IdempotencyKey.user_id == user.id,
+        IdempotencyKey.key.in_([operations[index]['key'] for index in pending]))} if pending else {}
+    for index in pending:
+        record = stored.get(operations[index]['key'])
+        if record is None:
+            continue
+        if record.request_hash == hashes[index]:
+            results[index] = dict(json.loads(record.response), replayed=True)
+        else:
+            results[index] = {'key': record.key, 'status': 409,
+                              'error': "This key was already used for a different operation"}
+
+    pending = [index for index in pending if results[index] is None]
+    target_ids = {operations[index]['id'] for index in pending if operations[index]['op'] != 'create'}
+    # Locked and re-read, like the single-row edit and delete paths
+    targets = {transaction.id: transaction for transaction in Transactions.locked(Transactions.query.filter(
+        Transactions.user_id == user.id, Transactions.id.in_(target_ids)))} if target_ids else {}
+
+    rollup = RollupDelta()
+    written, removed = {}, set()
+    try:
+        for index in pending:
+            operation = operations[index]
+            key = operation['key']
+            if operation['op'] == 'create':
+                try:
+                    transaction = Transactions(**validate_row(as_row(operation['transaction']), user.id))
+                except ValueError as e:
+                    results[index] = {'key': key, 'status': 400, 'error': str(e)}
+                    continue
+                db.session.add(transaction)
+                status = 201
+            else:
+                transaction = targets.get(operation['id'])
+                if transaction is None:
+                    status, error = missing_target(operation['id'], user.id)
+                    results[index] = {'key': key, 'status': status, 'error': error}
+                    continue
+                if operation['op'] == 'update':
+                    try:
+                        values = validate_row(dict(current_row(transaction), **as_row(operation['transaction'])),
+                                              user.id)
+                    except ValueError as e:
+                        results[index] = {'key': key, 'status': 400, 'error': str(e)}
+                        continue
+                    del values['id'], values['user_id']
+                    if not transaction.update_if_unchanged(values, rollup):
+                        results[index] = {'key': key, 'status': 409, 'error': CHANGED}
+                        continue
+                    removed.add(transaction.id)
+                    status = 200
+                else:
+                    if not transaction.delete_if_unchanged(rollup):
+                        results[index] = {'key': key, 'status': 409, 'error': CHANGED}
+                        continue
+                    del targets[transaction.id]
+                    written.pop(transaction.id, None)
+                    removed.add(transaction.id)
+                    results[index] = {'key': key, 'status': 204, 'id': transaction.id}
+
+            if results[index] is None:
+                if status == 201:
+                    rollup.add(transaction.date_added, transaction.trans_type, transaction.amount)
+                written[transaction.id] = transaction
+                results[index] = {'key': key, 'status': status, 'transaction': transaction.to_dict()}
+            # Only applied operations are remembered, so a rejected one can be corrected and resent
+            db.session.add(IdempotencyKey(user_id=user.id, key=key, request_hash=hashes[index],
+                                          status=results[index]['status'], response=json.dumps(results[index])))
+
+        if not written and not removed:
+            db.session.rollback()
+            return results
+        rollup.apply(user)
+        version = user.data_version
+        added = [transaction.cache_row() for transaction in written.values()]
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent request with some of the same keys committed first; a retry replays them
+        db.session.rollback()
+        raise BatchInProgress()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    Transactions.update_caches(user.id, version, added=added, removed=removed)
+    Users.data_changed(user.id)
+    return results
+
+
+def prune_keys(days):
+    """Delete idempotency keys older than `days`; an operation retried after that is applied again."""
+    cutoff = datetime.now() - timedelta(days=days)
+    deleted = db.session.execute(db.delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff)).rowcount
+    db.session.commit()
+    return deleted
@@ -0,0 +1,153 @@
+import time
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from .query_plans import check_dashboard_indexes
+from .importer import import_transactions, parse_statement, BATCH_SIZE
+from .models import Users
+from .forecast import refresh_all, HORIZON_MONTHS
+from .purge import purge_user, BATCH_SIZE as PURGE_BATCH_SIZE
+from .aggregates import rebuild_monthly_summary, verify_monthly_summary, balance_drift, reconcile_balances
+from .assets import build as build_assets
+from .archive import archive_transactions, archive_status, BATCH_SIZE as ARCHIVE_BATCH_SIZE
+from .batch import prune_keys
+
+rollups_cli = AppGroup('rollups', help="Maintain the MonthlySummary rollup table.")
+indexes_cli = AppGroup('indexes', help="Inspect how the database executes the dashboard queries.")
+users_cli = AppGroup('users', help="Manage user accounts.")
+forecast_cli = AppGroup('forecast', help="Precompute cash-flow forecasts.")
+balances_cli = AppGroup('balances', help="Check stored user balances against their transactions.")
+assets_cli = AppGroup('assets', help="Build fingerprinted, precompressed static files.")
+archive_cli = AppGroup('archive', help="Move old transactions out of the live table.")
+batch_cli = AppGroup('batch', help="Maintain the idempotency keys of the batch transaction API.")
+
+
+@rollups_cli.command('rebuild')
+@click.option('--user', 'user_id', default=None, help="Only rebuild this user's rollups.")
+def rebuild_rollups(user_id):
+    """Recompute the monthly rollups from the raw transactions."""
+    count = rebuild_monthly_summary(user_id)
+    click.echo(f"Rebuilt {count} monthly summary rows.")
+
+
+@rollups_cli.command('verify')
+@click.option('--user', 'user_id', default=None, help="Only verify this user's rollups.")
+def verify_rollups(user_id):
+    """Compare the monthly rollups with the raw transactions."""
+    mismatches = verify_monthly_summary(user_id)
+    for (uid, year, month, trans_type), (expected, stored) in sorted(mismatches.items(), key=str):
+        click.echo(f"{uid} {year}-{month:02d} {trans_type}: expected {expected}, stored {stored}")
+    if mismatches:
+        raise click.ClickException(f"{len(mismatches)} monthly summary rows are out of date; "
+                                   f"run 'flask rollups rebuild'.")
+    click.echo("Monthly summaries are up to date.")
+
+
+@balances_cli.command('reconcile')
+@click.option('--user', 'user_id', default=None, help="Only reconcile this user's balance.")
+@click.option('--fix/--dry-run', default=False, help="Repair drifted balances instead of only reporting them.")
+def reconcile(user_id, fix):
+    """Find balances that drifted from the sum of their transactions."""
+    drift = reconcile_balances(user_id) if fix else balance_drift(user_id)
+    for uid, (stored, expected) in sorted(drift.items()):
+        click.echo(f"{uid}: stored {stored}, expected {expected}")
+    if drift and not fix:
+        raise click.ClickException(f"{len(drift)} balances have drifted; rerun with --fix to repair them.")
+    click.echo(f"Repaired {len(drift)} balances." if fix else "All balances are consistent.")
+
+
+@indexes_cli.command('check')
+@click.option('--verbose', '-v', is_flag=True, help="Print the full query plans.")
+def check_indexes(verbose):
+    """EXPLAIN the dashboard queries and confirm they use the composite indexes."""
+    missing = 0
+    for name, (index, used, plan) in check_dashboard_indexes().items():
+        click.echo(f"{name}: {'uses' if used else 'DOES NOT use'} {index}")
+        if verbose or not used:
+            for line in plan:
+                click.echo(f"    {line}")
+        missing += not used
+    if missing:
+        raise click.ClickException(f"{missing} dashboard queries are not using their index; "
+                                   f"run 'flask db upgrade'.")
+
+
+@click.command('import-transactions')
+@click.argument('username')
+@click.argument('statement', type=click.File('rb'))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ofx']), default=None,
+              help="Statement format; guessed from the file extension by default.")
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True, help="Rows inserted per commit.")
+@with_appcontext
+def import_transactions_command(username, statement, file_format, batch_size):
+    """Bulk import a CSV or OFX STATEMENT into USERNAME's transactions."""
+    user = Users.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f"No user named {username!r}.")
+
+    rows = parse_statement(statement, statement.name, file_format)
+    result = import_transactions(user, rows, batch_size=batch_size)
+    for line_number, error in result.errors:
+        click.echo(f"line {line_number}: {error}", err=True)
+    click.echo(f"Imported {result.inserted} transactions, {len(result.errors)} rows skipped.")
+
+
+@forecast_cli.command('refresh')
+@click.option('--months', default=HORIZON_MONTHS, show_default=True, help="Months to forecast.")
+@click.option('--batch-size', default=500, show_default=True, help="Users forecast per batch.")
+def refresh_forecasts(months, batch_size):
+    """Recompute every user's forecast, e.g. from a nightly cron job."""
+    started = time.perf_counter()
+    count = refresh_all(months, batch_size)
+    click.echo(f"Refreshed {count} forecasts in {time.perf_counter() - started:.1f}s.")
+
+
+@users_cli.command('purge')
+@click.argument('username')
+@click.option('--batch-size', default=PURGE_BATCH_SIZE, show_default=True, help="Transactions deleted per commit.")
+@click.confirmation_option(prompt="This permanently deletes the account and all its data. Continue?")
+def purge(username, batch_size):
+    """Delete USERNAME together with all their data."""
+    user = Users.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f"No user named {username!r}.")
+    deleted = purge_user(user.id, batch_size)
+    click.echo(f"Deleted {username} and {deleted} transactions.")
+
+
+@assets_cli.command('build')
+def build_static_assets():
+    """Write content-hashed copies of the static files with .gz (and .br, if Brotli is installed) siblings."""
+    manifest = build_assets(current_app.static_folder)
+    click.echo(f"Built {len(manifest)} assets into {current_app.static_folder}/dist.")
+
+
+@archive_cli.command('run')
+@click.option('--months', default=None, type=int, help="Keep this many months live [default: ARCHIVE_AFTER_MONTHS].")
+@click.option('--batch-size', default=ARCHIVE_BATCH_SIZE, show_default=True, help="Rows moved per commit.")
+def run_archive(months, batch_size):
+    """Archive transactions older than the horizon; safe to interrupt and rerun."""
+    months = months or current_app.config['ARCHIVE_AFTER_MONTHS']
+    started = time.perf_counter()
+    try:
+        moved = archive_transactions(months, batch_size,
+                                     progress=lambda user_id, count: click.echo(f"{user_id}: {count}"))
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--months')
+    click.echo(f"Archived {moved} transactions in {time.perf_counter() - started:.1f}s.")
+
+
+@archive_cli.command('status')
+def show_archive_status():
+    """Show live and archived transaction counts."""
+    status = archive_status()
+    click.echo(f"Live: {status['live']}, archived: {status['archived']}, oldest live: {status['oldest_live']}")
+
+
+@batch_cli.command('prune-keys')
+@click.option('--days', type=int, default=None,
+              help="Keep keys this many days; IDEMPOTENCY_KEY_DAYS by default.")
+def prune_idempotency_keys(days):
+    """Delete old idempotency keys (run it from a scheduler)."""
+    deleted = prune_keys(days or current_app.config['IDEMPOTENCY_KEY_DAYS'])
+    click.echo(f"Deleted {deleted} idempotency keys.")
@@ -0,0 +1,90 @@
+import json
+import threading
+import time
+from collections import defaultdict
+from . import db
+
+
+class Broker:
+    """In-process fan-out of "this user's data changed" notifications.
+
+    Each gunicorn worker has its own broker, so a write handled by another
+    worker is not seen here; open streams also re-check the user's
+    data_version every heartbeat to pick those up.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, user_id):
+        event = threading.Event()
+        with self._lock:
+            self._subscribers[user_id].add(event)
+        return event
+
+    def unsubscribe(self, user_id, event):
+        with self._lock:
+            self._subscribers[user_id].discard(event)
+            if not self._subscribers[user_id]:
+                del self._subscribers[user_id]
+
+    def publish(self, user_id):
+        with self._lock:
+            for event in self._subscribers.get(user_id, ()):
+                event.set()
+
+
+broker = Broker()
+
+_stream_slots = None
+_stream_slots_lock = threading.Lock()
+
+
+def acquire_stream_slot(app):
+    """Reserve one of the worker's SSE_MAX_STREAMS stream slots without waiting.
+
+    Every open stream holds a request thread, so the cap keeps the rest free
+    for ordinary requests. Returns the function that releases the slot, or
+    None when they are all taken.
+    """
+    global _stream_slots
+    with _stream_slots_lock:
+        if _stream_slots is None:
+            _stream_slots = threading.BoundedSemaphore(app.config['SSE_MAX_STREAMS'])
+    if not _stream_slots.acquire(blocking=False):
+        return None
+    return _stream_slots.release
+
+
+def format_event(name, data, event_id=None):
+    lines = [f"event: {name}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def dashboard_stream(user_id, last_version, build_data, max_seconds, heartbeat, retry_ms):
+    from .models import Users
+
+    event = broker.subscribe(user_id)
+    try:
+        # Tell the browser how long to wait before reconnecting once this stream ends
+        yield f"retry: {retry_ms}\n\n"
+        deadline = time.monotonic() + max_seconds
+        while time.monotonic() < deadline:
+            event.clear()
+            user = db.session.get(Users, user_id)
+            if user is None:
+                return
+            if str(user.data_version) != last_version:
+                last_version = str(user.data_version)
+                yield format_event('dashboard', build_data(user), last_version)
+            # Don't hold a pooled connection while the stream is idle
+            db.session.remove()
+
+            if not event.wait(heartbeat):
+                yield ": keep-alive\n\n"
+    finally:
+        broker.unsubscribe(user_id, event)
@@ -0,0 +1,59 @@
+import csv
+import io
+import json
+import zlib
+from .models import Transactions, ArchivedTransactions
+from .pagination import filtered_transactions
+
+EXPORT_COLUMNS = ('id', 'date_added', 'amount', 'trans_type', 'category', 'transaction_frequency', 'duration',
+                  'description')
+YIELD_PER = 1000
+
+
+def export_rows(user_id, **filters):
+    """Yield the user's live and archived transactions oldest first as plain tuples, through a server-side cursor."""
+    live, archived = (filtered_transactions(user_id, model=model, **filters)
+                      .with_entities(*[getattr(model, name) for name in EXPORT_COLUMNS])
+                      for model in (Transactions, ArchivedTransactions))
+    query = live.union_all(archived) \
+        .order_by(Transactions.date_added, Transactions.id) \
+        .yield_per(YIELD_PER)
+    for row in query:
+        yield tuple(row)
+
+
+def _serialize(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def csv_chunks(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for count, row in enumerate(rows, 1):
+        writer.writerow([_serialize(value) for value in row])
+        if count % YIELD_PER == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def jsonl_chunks(rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(EXPORT_COLUMNS, map(_serialize, row)))))
+        if len(lines) == YIELD_PER:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
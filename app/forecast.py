@@ -0,0 +1,188 @@
+import json
+from datetime import datetime, date
+import numpy as np
+from sqlalchemy import extract, func
+from sqlalchemy.exc import IntegrityError
+from . import db
+from .forms import CATEGORY_CHOICES
+from .models import Users, Transactions, ArchivedTransactions, UserForecast
+from .recurring import MONTH_STEPS, DAY_STEPS, expand
+
+HISTORY_MONTHS = 6
+HORIZON_MONTHS = 6
+MAX_HORIZON_MONTHS = 24
+
+CATEGORIES = [value for value, _ in CATEGORY_CHOICES if value is not None] + ['Other']
+CATEGORY_INDEX = {category: index for index, category in enumerate(CATEGORIES)}
+TYPES = ('Income', 'Expense')
+RECURRING_FREQUENCIES = list(MONTH_STEPS) + list(DAY_STEPS)
+
+
+def month_number(year, month):
+    """Months since January 1970, the same scale as numpy datetime64[M]."""
+    return (year - 1970) * 12 + month - 1
+
+
+def month_label(number):
+    return f"{1970 + number // 12}-{number % 12 + 1:02d}"
+
+
+def series_index(category, trans_type):
+    return CATEGORY_INDEX.get(category, len(CATEGORIES) - 1) * 2 + TYPES.index(trans_type)
+
+
+def load_history(user_ids, first_month, current_month):
+    """One grouped query for the one-off transactions of every user in the batch over the history window."""
+    year_col = extract('year', Transactions.date_added)
+    month_col = extract('month', Transactions.date_added)
+    start = datetime(1970 + first_month // 12, first_month % 12 + 1, 1)
+    end = datetime(1970 + current_month // 12, current_month % 12 + 1, 1)
+    return db.session.query(Transactions.user_id, year_col, month_col, Transactions.category,
+                            Transactions.trans_type, func.sum(Transactions.amount)) \
+        .filter(Transactions.user_id.in_(user_ids), Transactions.trans_type.in_(TYPES),
+                Transactions.date_added >= start, Transactions.date_added < end,
+                (Transactions.duration == 0) | Transactions.transaction_frequency.notin_(RECURRING_FREQUENCIES)) \
+        .group_by(Transactions.user_id, year_col, month_col, Transactions.category, Transactions.trans_type) \
+        .all()
+
+
+def load_rules(user_ids):
+    rules = []
+    # Archived rules may still have occurrences inside the forecast horizon
+    for model in (Transactions, ArchivedTransactions):
+        rules += db.session.query(model.user_id, model.date_added, model.amount, model.category,
+                                  model.trans_type, model.transaction_frequency, model.duration) \
+            .filter(model.user_id.in_(user_ids), model.trans_type.in_(TYPES),
+                    model.duration > 0, model.transaction_frequency.in_(RECURRING_FREQUENCIES)) \
+            .all()
+    return rules
+
+
+def compute_forecasts(users, horizon=HORIZON_MONTHS, history=HISTORY_MONTHS, today=None):
+    """Forecast the next `horizon` months for a batch of users at once.
+
+    One-off spending and income are projected as the per-category average of
+    the last `history` months; recurring transactions contribute their actual
+    scheduled occurrences. Everything is held in (user, series, month) arrays,
+    so the cost is a couple of queries and a few array operations per batch.
+    Returns {user_id: forecast dict}.
+    """
+    today = today or date.today()
+    current = month_number(today.year, today.month)
+    user_index = {user.id: index for index, user in enumerate(users)}
+    ids = list(user_index)
+    series = len(CATEGORIES) * 2
+
+    past = np.zeros((len(users), series, history), dtype=np.int64)
+    rows = load_history(ids, current - history, current)
+    if rows:
+        uid, year, month, category, trans_type, amount = zip(*rows)
+        np.add.at(past,
+                  (np.array([user_index[u] for u in uid]),
+                   np.array([series_index(c, t) for c, t in zip(category, trans_type)]),
+                   np.array([month_number(int(y), int(m)) for y, m in zip(year, month)]) - (current - history)),
+                  np.array(amount, dtype=np.int64))
+    future = np.repeat(past.mean(axis=2)[:, :, None], horizon, axis=2)
+    balance = np.array([user.balance for user in users], dtype=np.float64)
+
+    rules = load_rules(ids)
+    if rules:
+        uid, date_added, amount, category, trans_type, frequency, duration = zip(*rules)
+        rule, _, dates = expand(np.array([d.date() for d in date_added], dtype='datetime64[D]'),
+                                np.array([MONTH_STEPS.get(f, 0) for f in frequency], dtype=np.int64),
+                                np.array([DAY_STEPS.get(f, 0) for f in frequency], dtype=np.int64),
+                                np.array(duration, dtype=np.int64))
+        users_of = np.array([user_index[u] for u in uid])[rule]
+        series_of = np.array([series_index(c, t) for c, t in zip(category, trans_type)])[rule]
+        amount_of = np.array(amount, dtype=np.int64)[rule]
+        offset = dates.astype('datetime64[M]').astype(np.int64) - current - 1
+
+        upcoming = (offset >= 0) & (offset < horizon)
+        np.add.at(future, (users_of[upcoming], series_of[upcoming], offset[upcoming]), amount_of[upcoming])
+
+        # Occurrences still due later this month move the starting balance
+        pending = (offset == -1) & (dates >= np.datetime64(today))
+        signs = np.where(series_of % 2 == 0, 1, -1)
+        np.add.at(balance, users_of[pending], signs[pending] * amount_of[pending])
+
+    income = future[:, 0::2, :].sum(axis=1)
+    expense = future[:, 1::2, :].sum(axis=1)
+    projected = balance[:, None] + np.cumsum(income - expense, axis=1)
+    months = [month_label(current + 1 + offset) for offset in range(horizon)]
+
+    forecasts = {}
+    for user_id, index in user_index.items():
+        categories = {}
+        for category_index, category in enumerate(CATEGORIES):
+            for type_index, trans_type in enumerate(TYPES):
+                values = future[index, category_index * 2 + type_index]
+                if values.any():
+                    categories.setdefault(category, {})[trans_type.lower()] = np.rint(values).astype(int).tolist()
+        forecasts[user_id] = {
+            'months': months,
+            'income': np.rint(income[index]).astype(int).tolist(),
+            'expense': np.rint(expense[index]).astype(int).tolist(),
+            'balance': np.rint(projected[index]).astype(int).tolist(),
+            'overspending': [month for month, over in zip(months, expense[index] > income[index]) if over],
+            'categories': categories,
+        }
+    return forecasts
+
+
+def store_forecasts(users, forecasts, horizon, today=None):
+    computed_for = (today or date.today()).strftime('%Y-%m')
+    ids = [user.id for user in users]
+    db.session.execute(db.delete(UserForecast).where(UserForecast.user_id.in_(ids)))
+    db.session.execute(db.insert(UserForecast), [
+        dict(user_id=user.id, data_version=user.data_version, computed_for=computed_for, horizon=horizon,
+             payload=json.dumps(forecasts[user.id]), computed_at=datetime.now())
+        for user in users
+    ])
+    db.session.commit()
+
+
+def get_forecast(user, horizon=HORIZON_MONTHS):
+    """Return the user's forecast, recomputing it only if a transaction changed since it was cached."""
+    horizon = max(1, min(horizon, MAX_HORIZON_MONTHS))
+    cached = db.session.get(UserForecast, user.id)
+    if cached is not None and cached.data_version == user.data_version \
+            and cached.computed_for == date.today().strftime('%Y-%m') and cached.horizon >= horizon:
+        forecast = json.loads(cached.payload)
+    else:
+        forecast = compute_forecasts([user], max(horizon, HORIZON_MONTHS))[user.id]
+        try:
+            store_forecasts([user], {user.id: forecast}, max(horizon, HORIZON_MONTHS))
+        except IntegrityError:
+            # A concurrent request stored it first; ours is just as fresh
+            db.session.rollback()
+
+    if len(forecast['months']) > horizon:
+        forecast = trim(forecast, horizon)
+    return forecast
+
+
+def trim(forecast, horizon):
+    months = forecast['months'][:horizon]
+    return {
+        'months': months,
+        'income': forecast['income'][:horizon],
+        'expense': forecast['expense'][:horizon],
+        'balance': forecast['balance'][:horizon],
+        'overspending': [month for month in forecast['overspending'] if month in months],
+        'categories': {category: {key: values[:horizon] for key, values in series.items()}
+                       for category, series in forecast['categories'].items()},
+    }
+
+
+def refresh_all(horizon=HORIZON_MONTHS, batch_size=500):
+    """Recompute and store every user's forecast, batch_size users per query round. Returns the user count."""
+    count = 0
+    last_id = ''
+    while True:
+        users = Users.query.filter(Users.id > last_id).order_by(Users.id).limit(batch_size).all()
+        if not users:
+            return count
+        last_id = users[-1].id
+        store_forecasts(users, compute_forecasts(users, horizon), horizon)
+        count += len(users)
+        db.session.expunge_all()
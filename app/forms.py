@@ -1,7 +1,7 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, SubmitField, SelectField, IntegerField, TextAreaField, TelField, PasswordField
 from wtforms.validators import DataRequired, EqualTo
-from flask_wtf.file import FileField
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 
 TYPE_CHOICES = [(None, 'Select a type'), ('Income', 'Income'), ('Expense', 'Expenses')]
 CATEGORY_CHOICES = [(None, 'Select a type'), ('Freelance Job', 'Freelance Job'), ('Salary', 'Salary'), ('Gift', 'Gift'),
@@ -53,3 +53,13 @@ class LoginForm(FlaskForm):
     username = StringField(label="Username", validators=[DataRequired()])
     password = PasswordField(label="Password", validators=[DataRequired()])
     submit = SubmitField("Submit")
+
+
+class DeleteUserForm(FlaskForm):
+    submit = SubmitField("Delete")
+
+
+class ImportForm(FlaskForm):
+    statement = FileField(label="Statement (CSV or OFX)",
+                          validators=[FileRequired(), FileAllowed(['csv', 'ofx', 'qfx'], "CSV or OFX files only")])
+    submit = SubmitField("Import")
@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from flask import render_template
+from flask_login import current_user
+from markupsafe import Markup
+
+
+class MemoryBackend:
+    """Size-bounded LRU of rendered fragments, private to one worker process."""
+
+    def __init__(self, maxsize=3000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+
+class RedisBackend:
+    """Fragments shared by every worker through a Redis-compatible server."""
+
+    def __init__(self, client, ttl=300):
+        self.client = client
+        self.ttl = ttl
+
+    @classmethod
+    def from_url(cls, url, ttl=300):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("FRAGMENT_CACHE = 'redis' needs the redis package installed")
+        return cls(redis.Redis.from_url(url), ttl)
+
+    def get(self, key):
+        value = self.client.get(key)
+        if value is None:
+            return None
+        tag, _, html = value.decode('utf-8').partition('\n')
+        return tag, html
+
+    def set(self, key, value):
+        tag, html = value
+        self.client.set(key, f"{tag}\n{html}", ex=self.ttl)
+
+    def delete(self, keys):
+        if keys:
+            self.client.delete(*keys)
+
+
+class FragmentCache:
+    """Rendered HTML of per-user template fragments, reused until the user's data changes.
+
+    Each fragment registers a builder that loads its template context. The
+    `fragment(template)` template global renders it for current_user. The
+    result is stored under the user's data_version, which every Transactions
+    write bumps, so a warm render needs neither the builder's queries nor Jinja.
+    Users.data_changed also drops the user's entries so that other changes,
+    such as a profile edit, show up at once. With no backend configured,
+    fragments are rendered on every request.
+    """
+
+    def __init__(self):
+        self.backend = None
+        self._builders = {}
+
+    def init_app(self, app):
+        kind = app.config.get('FRAGMENT_CACHE')
+        ttl = app.config.get('FRAGMENT_CACHE_TTL', 300)
+        if kind == 'memory':
+            self.backend = MemoryBackend(app.config.get('FRAGMENT_CACHE_SIZE', 3000), ttl)
+        elif kind == 'redis':
+            self.backend = RedisBackend.from_url(app.config['FRAGMENT_CACHE_URL'], ttl)
+        app.add_template_global(self.render, 'fragment')
+
+    def fragment(self, template):
+        """Register the function that returns the template context of a cached fragment."""
+        def decorator(builder):
+            self._builders[template] = builder
+            return builder
+        return decorator
+
+    @staticmethod
+    def key(user_id, template):
+        return f"fragment:{user_id}:{template}"
+
+    def render(self, template):
+        user = current_user._get_current_object()
+        key = self.key(user.id, template)
+        # Dashboard figures are for the current year, so a new year needs a fresh render too
+        tag = f"{user.data_version}:{date.today().year}"
+        if self.backend is not None:
+            cached = self.backend.get(key)
+            if cached is not None and cached[0] == tag:
+                return Markup(cached[1])
+
+        html = render_template(template, **self._builders[template](user))
+        if self.backend is not None:
+            self.backend.set(key, (tag, html))
+        return Markup(html)
+
+    def invalidate(self, user_id):
+        if self.backend is not None:
+            self.backend.delete([self.key(user_id, template) for template in self._builders])
+
+
+fragment_cache = FragmentCache()
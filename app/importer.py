@@ -0,0 +1,188 @@
+import csv
+import io
+import re
+import uuid
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from . import db
+from .forms import TYPE_CHOICES, CATEGORY_CHOICES, RECURRING_CHOICES, DURATION_CHOICES
+from .models import Users, Transactions, RollupDelta, CachedRow
+
+VALID_TYPES = {value for value, _ in TYPE_CHOICES if value is not None}
+VALID_CATEGORIES = {value for value, _ in CATEGORY_CHOICES if value is not None}
+VALID_FREQUENCIES = {value for value, _ in RECURRING_CHOICES if value is not None}
+VALID_DURATIONS = {value for value, _ in DURATION_CHOICES if value is not None}
+DESCRIPTION_LENGTH = Transactions.description.type.length
+# amount is a signed 32-bit INTEGER on MySQL and PostgreSQL
+MAX_AMOUNT = 2 ** 31 - 1
+
+BATCH_SIZE = 1000
+OFX_DEFAULT_CATEGORY = 'Miscellaneous'
+
+
+class ImportResult:
+    def __init__(self):
+        self.inserted = 0
+        self.errors = []
+
+    def __repr__(self):
+        return '<ImportResult inserted=%r errors=%r>' % (self.inserted, len(self.errors))
+
+
+def parse_csv(stream):
+    """Yield (line_number, row) from a CSV with a header row.
+
+    Columns: date, amount, type, category, frequency, duration, description.
+    Only amount and category are required; see validate_row for the defaults.
+    """
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, {(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+
+
+OFX_TRANSACTION = re.compile(r'<STMTTRN>(.*?)</STMTTRN>', re.S | re.I)
+OFX_FIELD = re.compile(r'<(\w+)>([^<\r\n]*)')
+
+
+def parse_ofx(stream):
+    """Yield (transaction_number, row) for every <STMTTRN> block of an OFX (SGML or XML) statement."""
+    # Statements are read one block at a time so large files are never held in memory whole
+    buffer = ''
+    number = 0
+    for chunk in iter(lambda: stream.read(64 * 1024), ''):
+        buffer += chunk
+        end = 0
+        for match in OFX_TRANSACTION.finditer(buffer):
+            number += 1
+            fields = {name.upper(): value.strip() for name, value in OFX_FIELD.findall(match.group(1))}
+            amount = fields.get('TRNAMT', '')
+            yield number, {
+                'date': fields.get('DTPOSTED', '')[:8],
+                'amount': amount.lstrip('-+'),
+                'type': 'Expense' if amount.startswith('-') else 'Income',
+                'category': OFX_DEFAULT_CATEGORY,
+                'description': fields.get('MEMO') or fields.get('NAME', ''),
+            }
+            end = match.end()
+        buffer = buffer[end:]
+
+
+def parse_date(value):
+    if not value:
+        return datetime.now()
+    if len(value) == 8 and value.isdigit():
+        # OFX DTPOSTED
+        return datetime.strptime(value, '%Y%m%d')
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        # date_added is naive local time, like datetime.now() in the transaction form
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def validate_row(row, user_id):
+    """Turn a parsed row into Transactions column values, raising ValueError if it is invalid.
+
+    Amounts are stored in whole units like the transaction form, so decimals are rounded.
+    A negative amount with no type is imported as an Expense.
+    """
+    try:
+        amount = Decimal(row.get('amount', '').replace(',', ''))
+        if not amount.is_finite():
+            raise InvalidOperation()
+        trans_type = row.get('type') or ('Expense' if amount < 0 else 'Income')
+        rounded = abs(amount).quantize(Decimal(1), rounding=ROUND_HALF_UP) if abs(amount) <= MAX_AMOUNT else None
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount {row.get('amount')!r}")
+    if rounded is None or rounded > MAX_AMOUNT:
+        raise ValueError(f"Amount must not be more than {MAX_AMOUNT}")
+    amount = int(rounded)
+    if amount == 0:
+        raise ValueError("Amount must not be zero")
+    if trans_type not in VALID_TYPES:
+        raise ValueError(f"Invalid type {trans_type!r}")
+
+    category = row.get('category')
+    if category not in VALID_CATEGORIES:
+        raise ValueError(f"Invalid category {category!r}")
+    frequency = row.get('frequency') or 'Once'
+    if frequency not in VALID_FREQUENCIES:
+        raise ValueError(f"Invalid frequency {frequency!r}")
+    try:
+        duration = int(row.get('duration') or 0)
+    except ValueError:
+        duration = None
+    if duration not in VALID_DURATIONS:
+        raise ValueError(f"Invalid duration {row.get('duration')!r}")
+
+    description = row.get('description') or None
+    if description and len(description) > DESCRIPTION_LENGTH:
+        raise ValueError(f"Description is longer than {DESCRIPTION_LENGTH} characters")
+    try:
+        date_added = parse_date(row.get('date'))
+    except ValueError:
+        raise ValueError(f"Invalid date {row.get('date')!r}")
+
+    return {
+        'id': str(uuid.uuid4()),
+        'amount': amount,
+        'trans_type': trans_type,
+        'category': category,
+        'transaction_frequency': frequency,
+        'duration': duration,
+        'description': description,
+        'date_added': date_added,
+        'user_id': user_id,
+    }
+
+
+def insert_batch(user, values):
+    """Insert already-validated rows with one executemany and apply their balance and rollup deltas once."""
+    if not values:
+        return
+    db.session.execute(db.insert(Transactions), values)
+
+    rollup = RollupDelta()
+    for row in values:
+        rollup.add(row['date_added'], row['trans_type'], row['amount'])
+    rollup.apply(user)
+    version = user.data_version
+    db.session.commit()
+    Transactions.update_caches(user.id, version, added=[
+        CachedRow(row['id'], row['description'], row['category'], row['amount'], row['date_added'], row['trans_type'])
+        for row in values])
+
+
+def import_transactions(user, rows, batch_size=BATCH_SIZE):
+    """Validate and insert (line_number, row) pairs in batches, committing once per batch.
+
+    Invalid rows are skipped and reported in ImportResult.errors as (line_number, message).
+    """
+    result = ImportResult()
+    batch = []
+    try:
+        for line_number, row in rows:
+            try:
+                batch.append(validate_row(row, user.id))
+            except ValueError as e:
+                result.errors.append((line_number, str(e)))
+                continue
+            if len(batch) >= batch_size:
+                insert_batch(user, batch)
+                result.inserted += len(batch)
+                batch = []
+        insert_batch(user, batch)
+        result.inserted += len(batch)
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if result.inserted:
+            Users.data_changed(user.id)
+    return result
+
+
+def parse_statement(binary_stream, filename, file_format=None):
+    file_format = file_format or ('ofx' if filename.lower().endswith(('.ofx', '.qfx')) else 'csv')
+    text = io.TextIOWrapper(binary_stream, encoding='utf-8-sig', errors='replace', newline='')
+    return parse_ofx(text) if file_format == 'ofx' else parse_csv(text)
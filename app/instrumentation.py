@@ -0,0 +1,160 @@
+import threading
+import time
+from collections import Counter, defaultdict
+from flask import Response, g, request, request_started, request_finished, before_render_template, \
+    template_rendered
+from sqlalchemy import event
+from . import db
+
+# Upper bounds of the request duration histogram, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class RequestStats:
+    __slots__ = ('started', 'queries', 'db_time', 'template_time', 'template_started', 'statements')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_started = []
+        self.statements = Counter()
+
+    def repeated(self, threshold):
+        """The largest number of times one statement ran, if it reached the N+1 threshold."""
+        most = max(self.statements.values(), default=0)
+        return most if most >= threshold else 0
+
+
+class EndpointMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.duration = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.n_plus_one = 0
+
+
+class Metrics:
+    """Opt-in per-endpoint query, database and template timings.
+
+    Nothing is hooked unless METRICS_ENABLED is set, so a disabled app pays
+    nothing. When enabled, SQLAlchemy cursor events and Flask request and
+    template signals fill a RequestStats on `g`. Each response gets a
+    Server-Timing header, and the per-endpoint totals are served at /metrics
+    in the Prometheus text format. A request that runs the same statement
+    METRICS_N_PLUS_ONE times or more is counted and logged as a likely N+1.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.n_plus_one_threshold = 10
+        self._lock = threading.Lock()
+        self._endpoints = defaultdict(EndpointMetrics)
+
+    def init_app(self, app):
+        if not app.config.get('METRICS_ENABLED'):
+            return
+        self.enabled = True
+        self.n_plus_one_threshold = app.config.get('METRICS_N_PLUS_ONE', self.n_plus_one_threshold)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        request_started.connect(self._request_started, app)
+        request_finished.connect(self._request_finished, app)
+        before_render_template.connect(self._before_render_template, app)
+        template_rendered.connect(self._template_rendered, app)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    @staticmethod
+    def _stats():
+        # Queries outside a request (CLI, background threads) have no stats to add to
+        return g.get('_request_stats') if g else None
+
+    def _request_started(self, sender, **extra):
+        g._request_stats = RequestStats()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['_query_started'].pop()
+        stats = self._stats()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+            stats.statements[statement] += 1
+
+    def _before_render_template(self, sender, template, context, **extra):
+        stats = self._stats()
+        if stats is not None:
+            stats.template_started.append(time.perf_counter())
+
+    def _template_rendered(self, sender, template, context, **extra):
+        stats = self._stats()
+        if stats is not None and stats.template_started:
+            started = stats.template_started.pop()
+            # A fragment rendered while its page renders is already inside the page's time
+            if not stats.template_started:
+                stats.template_time += time.perf_counter() - started
+
+    def _request_finished(self, sender, response, **extra):
+        stats = g.pop('_request_stats', None)
+        if stats is None:
+            return
+        duration = time.perf_counter() - stats.started
+        endpoint = request.endpoint or 'unmatched'
+        repeated = stats.repeated(self.n_plus_one_threshold)
+        if repeated:
+            sender.logger.warning("Possible N+1 on %s: one statement ran %d times", endpoint, repeated)
+
+        response.headers['Server-Timing'] = ', '.join([
+            f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"',
+            f'tpl;dur={stats.template_time * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ])
+
+        with self._lock:
+            metrics = self._endpoints[endpoint]
+            metrics.requests += 1
+            metrics.duration += duration
+            for index, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    metrics.buckets[index] += 1
+            metrics.queries += stats.queries
+            metrics.db_time += stats.db_time
+            metrics.template_time += stats.template_time
+            metrics.n_plus_one += bool(repeated)
+
+    def render(self):
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            lines = ['# TYPE app_request_duration_seconds histogram']
+            for endpoint, metrics in endpoints:
+                for bound, count in zip(BUCKETS, metrics.buckets):
+                    lines.append(f'app_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+                lines.append(f'app_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} '
+                             f'{metrics.requests}')
+                lines.append(f'app_request_duration_seconds_sum{{endpoint="{endpoint}"}} {metrics.duration:.6f}')
+                lines.append(f'app_request_duration_seconds_count{{endpoint="{endpoint}"}} {metrics.requests}')
+            for name, kind, attribute in (('app_db_queries_total', 'counter', 'queries'),
+                                          ('app_db_seconds_total', 'counter', 'db_time'),
+                                          ('app_template_seconds_total', 'counter', 'template_time'),
+                                          ('app_n_plus_one_requests_total', 'counter', 'n_plus_one')):
+                lines.append(f'# TYPE {name} {kind}')
+                for endpoint, metrics in endpoints:
+                    value = getattr(metrics, attribute)
+                    value = f'{value:.6f}' if isinstance(value, float) else value
+                    lines.append(f'{name}{{endpoint="{endpoint}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+metrics = Metrics()
@@ -1,9 +1,19 @@
+from collections import defaultdict, namedtuple
 from datetime import datetime
+from flask import current_app
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import set_committed_value
 from . import db
+from .events import broker
+from .fragments import fragment_cache
+from .passwords import hash_password, check_password
+from .user_cache import user_cache
 import uuid
 
+# What the in-process caches (search index, analytics columns) keep of a written transaction
+CachedRow = namedtuple('CachedRow', 'id description category amount date_added trans_type')
+
 
 class Users(db.Model, UserMixin):
     id = db.Column(db.VARCHAR(60), primary_key=True)
@@ -13,6 +23,8 @@ class Users(db.Model, UserMixin):
     email = db.Column(db.String(180), nullable=False, unique=True)
     phone = db.Column(db.String(20), nullable=False)
     balance = db.Column(db.Integer, default=0, nullable=False)
+    # Bumped on every transaction write; used for ETags and to wake dashboard streams
+    data_version = db.Column(db.Integer, default=0, server_default='0', nullable=False)
     profile_pic = db.Column(db.String(100), nullable=True)
     date_added = db.Column(db.DateTime, default=datetime.now)
     password_hash = db.Column(db.String(180), nullable=False)
@@ -22,24 +34,41 @@ class Users(db.Model, UserMixin):
     def password(self):
         raise AttributeError("Password is not a readable attribute!!")
 
+    # Both go through the hashing pool with PASSWORD_HASH_METHOD and may raise HashingBusy
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(current_app._get_current_object(), password)
 
     def verify_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return check_password(current_app._get_current_object(), self.password_hash, password)[0]
 
-    def update_balance(self):
-        income = sum([txn.amount for txn in self.transactions if txn.trans_type == 'Income'])
-        expense = sum([txn.amount for txn in self.transactions if txn.trans_type == 'Expense'])
-        self.balance = income - expense
-        db.session.commit()
+    def adjust_balance(self, delta):
+        # Apply the change in SQL so concurrent writers can't overwrite each other
+        db.session.execute(db.update(Users).where(Users.id == self.id).values(
+            balance=Users.balance + delta, data_version=Users.data_version + 1))
+
+    @staticmethod
+    def data_changed(user_id):
+        # Call after committing a change to the user's row or transactions
+        user_cache.invalidate(user_id)
+        fragment_cache.invalidate(user_id)
+        broker.publish(user_id)
+
+    @property
+    def is_admin(self):
+        return self.username in current_app.config.get('ADMIN_USERNAMES', ())
+
+    @property
+    def dashboard_etag(self):
+        # The dashboard shows the current year, so a new year changes it without a write
+        return f"{self.id}-{self.data_version}-{datetime.now().year}"
 
     def __repr__(self):
         return '<Name %r>' % self.name
 
 
-class Transactions(db.Model):
+class TransactionFields:
+    """Columns and helpers shared by live and archived transactions."""
     id = db.Column(db.VARCHAR(60), primary_key=True)
     amount = db.Column(db.Integer, nullable=False)
     trans_type = db.Column(db.String(50), nullable=False)
@@ -50,6 +79,53 @@ class Transactions(db.Model):
     date_added = db.Column(db.DateTime, default=datetime.now)
     user_id = db.Column(db.VARCHAR(60), db.ForeignKey('users.id'), nullable=False)
 
+    @property
+    def signed_amount(self):
+        if self.trans_type == 'Income':
+            return self.amount
+        if self.trans_type == 'Expense':
+            return -self.amount
+        return 0
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'amount': self.amount,
+            'trans_type': self.trans_type,
+            'category': self.category,
+            'transaction_frequency': self.transaction_frequency,
+            'duration': self.duration,
+            'description': self.description,
+            'date_added': self.date_added.isoformat() if self.date_added else None,
+        }
+
+    def cache_row(self):
+        return CachedRow(self.id, self.description, self.category, self.amount, self.date_added, self.trans_type)
+
+
+class Transactions(TransactionFields, db.Model):
+    __table_args__ = (
+        # Per-user listings ordered by date (dashboard, wallet)
+        db.Index('ix_transactions_user_date', 'user_id', 'date_added', 'id'),
+        # Covers the per-month income/expense grouping without touching the table
+        db.Index('ix_transactions_user_type_date', 'user_id', 'trans_type', 'date_added', 'amount'),
+    )
+
+    @staticmethod
+    def for_user(user_id):
+        return Transactions.query.where(Transactions.user_id == user_id).order_by(Transactions.date_added.desc())
+
+    @staticmethod
+    def update_caches(user_id, version, added=(), removed=()):
+        # Keeps the in-process search index (used on SQLite) and analytics columns current without a rebuild
+        from .analytics import analytics_cache
+        from .search import transaction_index
+        transaction_index.apply(user_id, version - 1, version, added, removed)
+        analytics_cache.apply(user_id, version - 1, version, added, removed)
+
+    def apply_to_summary(self, sign=1):
+        MonthlySummary.apply_delta(self.user_id, self.date_added, self.trans_type, sign * self.amount, sign)
+
     @staticmethod
     def create_transaction(form, user):
         new_transaction = Transactions(
@@ -61,25 +137,191 @@ class Transactions(db.Model):
             duration=form.duration.data,
             description=form.description.data,
             user_id=user.id,
+            date_added=datetime.now(),
         )
         db.session.add(new_transaction)
-        user.update_balance()
+        new_transaction.apply_to_summary()
+        user.adjust_balance(new_transaction.signed_amount)
+        version, row = user.data_version, new_transaction.cache_row()
+        db.session.commit()
+        Transactions.update_caches(user.id, version, added=[row])
+        Users.data_changed(user.id)
+
+    @staticmethod
+    def locked(query):
+        # FOR UPDATE on MySQL/PostgreSQL (SQLite serialises writers instead), re-reading the rows so
+        # deltas are computed from their committed values rather than what the session loaded earlier
+        return query.with_for_update().populate_existing()
+
+    def unchanged(self):
+        # Matches this row only while the columns its balance and rollup deltas come from are as loaded
+        return (Transactions.id == self.id, Transactions.amount == self.amount,
+                Transactions.trans_type == self.trans_type, Transactions.date_added == self.date_added)
+
+    def update_if_unchanged(self, values, rollup):
+        """UPDATE this row to values if no other request changed it since it was loaded; returns whether it did.
+
+        Only then are the old and new amounts added to rollup, so two requests
+        editing the same row can't both apply their deltas.
+        """
+        update = db.update(Transactions).where(*self.unchanged()).values(**values) \
+            .execution_options(synchronize_session=False)
+        if db.session.execute(update).rowcount != 1:
+            return False
+        rollup.add(self.date_added, self.trans_type, self.amount, -1)
+        for name, value in values.items():
+            set_committed_value(self, name, value)
+        rollup.add(self.date_added, self.trans_type, self.amount)
+        return True
+
+    def delete_if_unchanged(self, rollup):
+        """DELETE this row unless another request changed or deleted it first; returns whether it did."""
+        delete = db.delete(Transactions).where(*self.unchanged()).execution_options(synchronize_session=False)
+        if db.session.execute(delete).rowcount != 1:
+            return False
+        db.session.expunge(self)
+        rollup.add(self.date_added, self.trans_type, self.amount, -1)
+        return True
 
     @staticmethod
     def update_transaction(transaction, form):
-        transaction.amount = form.amount.data
-        transaction.trans_type = form.trans_type.data
-        transaction.transaction_frequency = form.transaction_frequency.data
-        transaction.duration = form.duration.data
-        transaction.category = form.category.data
-        transaction.description = form.description.data
+        """Returns False, changing nothing, if the transaction was edited or deleted by another request meanwhile."""
+        transaction = Transactions.locked(Transactions.query.filter(Transactions.id == transaction.id)).first()
+        rollup = RollupDelta()
+        if transaction is None or not transaction.update_if_unchanged(dict(
+                amount=form.amount.data,
+                trans_type=form.trans_type.data,
+                transaction_frequency=form.transaction_frequency.data,
+                duration=form.duration.data,
+                category=form.category.data,
+                description=form.description.data,
+        ), rollup):
+            db.session.rollback()
+            return False
+        user = transaction.users
+        rollup.apply(user)
+        version, row = user.data_version, transaction.cache_row()
         db.session.commit()
-        transaction.users.update_balance()
+        Transactions.update_caches(user.id, version, added=[row], removed=[row.id])
+        Users.data_changed(user.id)
+        return True
 
     @staticmethod
     def delete_transaction(transaction):
-        db.session.delete(transaction)
-        transaction.users.update_balance()
+        """Returns False if the transaction was already deleted (say by a double-click) or edited meanwhile."""
+        transaction = Transactions.locked(Transactions.query.filter(Transactions.id == transaction.id)).first()
+        rollup = RollupDelta()
+        if transaction is None:
+            db.session.rollback()
+            return False
+        user = transaction.users
+        if not transaction.delete_if_unchanged(rollup):
+            db.session.rollback()
+            return False
+        rollup.apply(user)
+        version = user.data_version
+        db.session.commit()
+        Transactions.update_caches(user.id, version, removed=[transaction.id])
+        Users.data_changed(user.id)
+        return True
 
     def __repr__(self):
         return '<Transaction %r>' % self.id
+
+
+class ArchivedTransactions(TransactionFields, db.Model):
+    """Transactions moved out of the live table by the archive job (see app.archive).
+
+    They still count towards the balance and the MonthlySummary rollups, and
+    export and search include them, but they can no longer be edited.
+    """
+    __tablename__ = 'transactions_archive'
+    __table_args__ = (
+        db.Index('ix_transactions_archive_user_date', 'user_id', 'date_added', 'id'),
+    )
+
+    def __repr__(self):
+        return '<ArchivedTransaction %r>' % self.id
+
+
+class MonthlySummary(db.Model):
+    """Per-user monthly rollup of transaction amounts, kept in step by the Transactions write paths."""
+    user_id = db.Column(db.VARCHAR(60), db.ForeignKey('users.id'), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    month = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    trans_type = db.Column(db.String(50), primary_key=True)
+    amount = db.Column(db.BigInteger, default=0, nullable=False)
+    txn_count = db.Column(db.Integer, default=0, nullable=False)
+
+    @staticmethod
+    def apply_delta(user_id, when, trans_type, amount, txn_count=1):
+        key = (MonthlySummary.user_id == user_id, MonthlySummary.year == when.year,
+               MonthlySummary.month == when.month, MonthlySummary.trans_type == trans_type)
+        update = db.update(MonthlySummary).where(*key).values(
+            amount=MonthlySummary.amount + amount, txn_count=MonthlySummary.txn_count + txn_count)
+
+        if db.session.execute(update).rowcount == 0:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(db.insert(MonthlySummary).values(
+                        user_id=user_id, year=when.year, month=when.month, trans_type=trans_type,
+                        amount=amount, txn_count=txn_count))
+            except IntegrityError:
+                # Another request created the row first; apply the delta to it instead
+                db.session.execute(update)
+
+    def __repr__(self):
+        return '<MonthlySummary %r %r-%r %r>' % (self.user_id, self.year, self.month, self.trans_type)
+
+
+class RollupDelta:
+    """Balance and MonthlySummary changes of many transaction writes, applied with one statement per bucket."""
+
+    def __init__(self):
+        self.months = defaultdict(lambda: [0, 0])
+        self.balance = 0
+
+    def add(self, date_added, trans_type, amount, sign=1):
+        delta = self.months[(date_added.year, date_added.month, trans_type)]
+        delta[0] += sign * amount
+        delta[1] += sign
+        self.balance += sign * (amount if trans_type == 'Income' else -amount if trans_type == 'Expense' else 0)
+
+    def apply(self, user):
+        for (year, month, trans_type), (amount, count) in self.months.items():
+            # An edit that only changed the description cancels out
+            if amount or count:
+                MonthlySummary.apply_delta(user.id, datetime(year, month, 1), trans_type, amount, count)
+        user.adjust_balance(self.balance)
+
+
+class UserForecast(db.Model):
+    """Cached cash-flow forecast; valid while data_version and computed_for match the user and month."""
+    user_id = db.Column(db.VARCHAR(60), db.ForeignKey('users.id'), primary_key=True)
+    data_version = db.Column(db.Integer, nullable=False)
+    computed_for = db.Column(db.String(7), nullable=False)
+    horizon = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return '<UserForecast %r %r>' % (self.user_id, self.computed_for)
+
+
+class IdempotencyKey(db.Model):
+    """Result of an operation applied through /api/transactions:batch, replayed when the client retries it."""
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        # `flask batch prune-keys` deletes by age
+        db.Index('ix_idempotency_keys_created_at', 'created_at'),
+    )
+    user_id = db.Column(db.VARCHAR(60), db.ForeignKey('users.id'), primary_key=True)
+    key = db.Column(db.String(100), primary_key=True)
+    # sha256 of the operation, so a key reused for a different operation is refused
+    request_hash = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.Integer, nullable=False)
+    response = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
+
+    def __repr__(self):
+        return '<IdempotencyKey %r %r>' % (self.user_id, self.key)
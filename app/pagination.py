@@ -0,0 +1,74 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_
+from .models import Transactions
+
+PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(transaction):
+    raw = f"{transaction.date_added.isoformat()}|{transaction.id}"
+    return urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        date_added, transaction_id = raw.split('|', 1)
+        return datetime.fromisoformat(date_added), transaction_id
+    except ValueError as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+
+
+def parse_filters(args):
+    """Read the category, type and start/end date (YYYY-MM-DD, inclusive) filters from request args."""
+    filters = {
+        'category': args.get('category') or None,
+        'trans_type': args.get('type') or None,
+        'start': None,
+        'end': None,
+    }
+    for key in ('start', 'end'):
+        if args.get(key):
+            try:
+                filters[key] = datetime.strptime(args[key], '%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f"Invalid {key} date {args[key]!r}, expected YYYY-MM-DD")
+    return filters
+
+
+def filtered_transactions(user_id, category=None, trans_type=None, start=None, end=None, model=Transactions):
+    query = model.query.where(model.user_id == user_id)
+    if category:
+        query = query.where(model.category == category)
+    if trans_type:
+        query = query.where(model.trans_type == trans_type)
+    if start:
+        query = query.where(model.date_added >= start)
+    if end:
+        query = query.where(model.date_added < end + timedelta(days=1))
+    return query
+
+
+def transaction_page(user_id, after=None, limit=PAGE_SIZE, **filters):
+    """Return (transactions, next_cursor) for one page, newest first.
+
+    Pages are keyed on (date_added, id) rather than OFFSET, so each page is a
+    range scan of ix_transactions_user_date no matter how deep it is.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = filtered_transactions(user_id, **filters)
+    if after:
+        date_added, transaction_id = decode_cursor(after)
+        query = query.where(or_(Transactions.date_added < date_added,
+                                and_(Transactions.date_added == date_added, Transactions.id < transaction_id)))
+
+    # Fetch one extra row to know whether there is a next page
+    rows = query.order_by(Transactions.date_added.desc(), Transactions.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
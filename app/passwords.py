@@ -0,0 +1,73 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from threading import BoundedSemaphore, Lock
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HashingBusy(Exception):
+    """Raised when too many password hashes are already queued; the client should retry later."""
+
+
+_executor = None
+_slots = None
+_executor_lock = Lock()
+
+
+def get_executor(app):
+    # Created on first use so each gunicorn worker starts its own processes after forking.
+    # spawn rather than fork: forking a process that is running request threads is unsafe.
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=app.config['PASSWORD_HASH_WORKERS'],
+                                            mp_context=multiprocessing.get_context('spawn'))
+            _slots = BoundedSemaphore(app.config['PASSWORD_HASH_QUEUE'])
+        return _executor, _slots
+
+
+def needs_rehash(password_hash, method):
+    # Werkzeug prefixes each hash with the method and parameters it was made with
+    return password_hash.split('$', 1)[0] != method
+
+
+def verify_and_update(password_hash, password, method):
+    """Check a password; if it matches a hash made with outdated parameters, also return a new hash."""
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if needs_rehash(password_hash, method):
+        return True, generate_password_hash(password, method)
+    return True, None
+
+
+def run(app, function, *args):
+    """Run a hashing function in the process pool, or inline when PASSWORD_HASH_WORKERS is 0.
+
+    At most PASSWORD_HASH_QUEUE hashes are queued or running per worker; past
+    that HashingBusy is raised at once, so a burst of logins cannot tie up
+    every request thread while the dashboard waits behind it.
+    """
+    if not app.config['PASSWORD_HASH_WORKERS']:
+        return function(*args)
+
+    executor, slots = get_executor(app)
+    if not slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = executor.submit(function, *args)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=app.config['PASSWORD_HASH_TIMEOUT'])
+    except TimeoutError:
+        raise HashingBusy()
+
+
+def hash_password(app, password):
+    return run(app, generate_password_hash, password, app.config['PASSWORD_HASH_METHOD'])
+
+
+def check_password(app, password_hash, password):
+    """Returns (matches, new_hash); new_hash is set when the stored hash should be upgraded."""
+    return run(app, verify_and_update, password_hash, password, app.config['PASSWORD_HASH_METHOD'])
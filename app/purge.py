@@ -0,0 +1,42 @@
+from flask import current_app
+from . import db
+from .avatars import release_avatar
+from .models import Users, Transactions, ArchivedTransactions, MonthlySummary, UserForecast, IdempotencyKey
+
+BATCH_SIZE = 5000
+
+
+def delete_in_batches(model, column, value, batch_size=BATCH_SIZE):
+    """Delete every row where column == value, batch_size primary keys per statement and commit.
+
+    Short transactions keep row locks brief on big accounts; the id lookup
+    goes through the user_id index, so each batch costs the same.
+    """
+    deleted = 0
+    while True:
+        ids = [row[0] for row in db.session.query(model.id).filter(column == value).limit(batch_size)]
+        if not ids:
+            return deleted
+        db.session.execute(db.delete(model).where(model.id.in_(ids)))
+        db.session.commit()
+        deleted += len(ids)
+
+
+def purge_user(user_id, batch_size=BATCH_SIZE):
+    """Remove a user with all their transactions, rollups, cached forecast, batch API keys and profile picture.
+
+    Returns the number of transactions deleted.
+    """
+    profile_pic = db.session.query(Users.profile_pic).filter(Users.id == user_id).scalar()
+
+    deleted = delete_in_batches(Transactions, Transactions.user_id, user_id, batch_size)
+    deleted += delete_in_batches(ArchivedTransactions, ArchivedTransactions.user_id, user_id, batch_size)
+    db.session.execute(db.delete(MonthlySummary).where(MonthlySummary.user_id == user_id))
+    db.session.execute(db.delete(UserForecast).where(UserForecast.user_id == user_id))
+    db.session.execute(db.delete(IdempotencyKey).where(IdempotencyKey.user_id == user_id))
+    db.session.execute(db.delete(Users).where(Users.id == user_id))
+    db.session.commit()
+    Users.data_changed(user_id)
+
+    release_avatar(profile_pic, current_app.config['UPLOAD_FOLDER'])
+    return deleted
@@ -0,0 +1,42 @@
+from sqlalchemy import text
+from . import db
+from .models import Transactions
+from .aggregates import grouped_transactions_query
+
+# Dashboard queries and the index each one is expected to use
+DASHBOARD_QUERIES = {
+    'recent transactions': (lambda user_id: Transactions.for_user(user_id).limit(4),
+                            'ix_transactions_user_date'),
+    'wallet list': (lambda user_id: Transactions.for_user(user_id),
+                    'ix_transactions_user_date'),
+    'monthly grouping': (lambda user_id: grouped_transactions_query(user_id),
+                         'ix_transactions_user_type_date'),
+}
+
+EXPLAIN_PREFIX = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'mysql': 'EXPLAIN ',
+    'mariadb': 'EXPLAIN ',
+    'postgresql': 'EXPLAIN ',
+}
+
+
+def explain(query):
+    dialect = db.engine.dialect
+    sql = query.statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(text(EXPLAIN_PREFIX[dialect.name] + str(sql))).all()
+    return [' '.join(str(value) for value in row) for row in rows]
+
+
+def check_dashboard_indexes(user_id='explain-check'):
+    """Return {name: (index, used, plan)} for every dashboard query."""
+    if db.engine.dialect.name == 'postgresql':
+        # Small tables make a sequential scan look cheaper; we only care whether the index is usable
+        db.session.execute(text('SET LOCAL enable_seqscan = off'))
+
+    results = {}
+    for name, (build, index) in DASHBOARD_QUERIES.items():
+        plan = explain(build(user_id))
+        results[name] = (index, any(index in line for line in plan), plan)
+    db.session.rollback()
+    return results
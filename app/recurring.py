@@ -0,0 +1,100 @@
+from collections import defaultdict
+from functools import lru_cache
+import numpy as np
+from . import db
+from .models import Transactions, ArchivedTransactions
+
+# Spacing between occurrences for each RECURRING_CHOICES value, in months or days
+MONTH_STEPS = {'Monthly': 1, 'Quarterly': 3, 'Trimester': 4, 'Semester': 6, 'Annually': 12}
+DAY_STEPS = {'Weekly': 7, 'Fortnightly': 14}
+
+
+def add_months(dates, months):
+    """Vectorized calendar-month addition on datetime64[D] arrays, clamping to the end of shorter months."""
+    month_start = dates.astype('datetime64[M]')
+    day = (dates - month_start.astype('datetime64[D]')).astype(np.int64)
+    target = month_start + months
+    month_length = ((target + 1).astype('datetime64[D]') - target.astype('datetime64[D]')).astype(np.int64)
+    return target.astype('datetime64[D]') + np.minimum(day, month_length - 1)
+
+
+def expand(start, step_months, step_days, duration):
+    """Expand recurring rules into their occurrences.
+
+    Every argument is an array with one entry per rule; a rule recurs every
+    step_months months or step_days days (the other step is 0) for duration
+    months from start. Returns (rule_index, occurrence_number, date) arrays
+    for every occurrence after the first, which is the stored transaction.
+    """
+    end = add_months(start, duration)
+    span_days = (end - start).astype(np.int64)
+    # Occurrences 0..n-1 fall strictly before the end of the rule's duration
+    count = np.where(step_months > 0, -(-duration // np.maximum(step_months, 1)),
+                     -(-span_days // np.maximum(step_days, 1)))
+    count = np.where((step_months > 0) | (step_days > 0), count, 1)
+
+    rule = np.repeat(np.arange(len(start)), count)
+    first = np.repeat(np.cumsum(count) - count, count)
+    number = np.arange(len(rule)) - first
+
+    projected = number > 0
+    rule, number = rule[projected], number[projected]
+    dates = np.where(step_months[rule] > 0,
+                     add_months(start[rule], number * step_months[rule]),
+                     start[rule] + number * step_days[rule])
+    return rule, number, dates
+
+
+def load_rules(user_id):
+    rules = []
+    # An archived rule can still be projecting into the months the dashboard shows
+    for model in (Transactions, ArchivedTransactions):
+        rules += db.session.query(model.date_added, model.amount, model.trans_type,
+                                  model.transaction_frequency, model.duration) \
+            .filter(model.user_id == user_id, model.duration > 0,
+                    model.transaction_frequency.in_(list(MONTH_STEPS) + list(DAY_STEPS))) \
+            .all()
+    return rules
+
+
+class RecurringProjection:
+    """Amounts contributed by the not-yet-stored occurrences of a user's recurring transactions."""
+
+    def __init__(self, monthly=None, balance_delta=0, occurrences=0):
+        # {(year, month, trans_type): amount}
+        self.monthly = monthly or {}
+        self.balance_delta = balance_delta
+        self.occurrences = occurrences
+
+
+def project(rules):
+    if not rules:
+        return RecurringProjection()
+
+    date_added, amount, trans_type, frequency, duration = zip(*rules)
+    start = np.array([d.date() for d in date_added], dtype='datetime64[D]')
+    step_months = np.array([MONTH_STEPS.get(f, 0) for f in frequency], dtype=np.int64)
+    step_days = np.array([DAY_STEPS.get(f, 0) for f in frequency], dtype=np.int64)
+    amount = np.array(amount, dtype=np.int64)
+    is_income = np.array([t == 'Income' for t in trans_type])
+    is_expense = np.array([t == 'Expense' for t in trans_type])
+
+    rule, _, dates = expand(start, step_months, step_days, np.array(duration, dtype=np.int64))
+    months = dates.astype('datetime64[M]').astype(np.int64)
+
+    monthly = defaultdict(int)
+    for name, mask in (('Income', is_income[rule]), ('Expense', is_expense[rule])):
+        # Sum occurrence amounts per month since the epoch in one pass
+        keys, inverse = np.unique(months[mask], return_inverse=True)
+        sums = np.bincount(inverse, weights=amount[rule][mask], minlength=len(keys))
+        for key, total in zip(keys.tolist(), sums.tolist()):
+            monthly[(1970 + key // 12, key % 12 + 1, name)] += int(total)
+
+    signed = np.where(is_income, amount, np.where(is_expense, -amount, 0))
+    return RecurringProjection(dict(monthly), int(signed[rule].sum()), len(rule))
+
+
+@lru_cache(maxsize=1024)
+def recurring_projection(user_id, data_version):
+    # data_version changes on every transaction write, so a cached entry is never stale
+    return project(load_rules(user_id))
@@ -0,0 +1,48 @@
+import time
+from functools import wraps
+from flask import current_app, session
+from flask_sqlalchemy.session import Session
+
+REPLICA_BIND = 'replica'
+
+
+class RoutingSession(Session):
+    """Session that sends the reads of read-only views to the replica bind.
+
+    Views wrapped in read_replica set info['replica']; everything else, and
+    any flush or INSERT/UPDATE/DELETE even inside such a view, goes to the
+    primary. Once a session has written, the rest of its reads stay on the
+    primary too.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or getattr(clause, 'is_dml', False):
+                self.info['wrote'] = True
+            elif self.info.get('replica') and not self.info.get('wrote'):
+                engine = self._db.engines.get(REPLICA_BIND)
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_replica(view):
+    """Serve the view's reads from the replica, unless this browser wrote within REPLICA_STICKY_SECONDS."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if session.get('primary_until', 0) < time.time():
+            current_app.extensions['sqlalchemy'].session.info['replica'] = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def init_app(app):
+    if REPLICA_BIND not in app.config.get('SQLALCHEMY_BINDS', {}):
+        return
+
+    @app.after_request
+    def stick_to_primary(response):
+        # Read-your-writes: the browser's next few requests read the primary while the replica catches up
+        if app.extensions['sqlalchemy'].session.info.get('wrote'):
+            session['primary_until'] = time.time() + app.config['REPLICA_STICKY_SECONDS']
+        return response
@@ -1,20 +1,30 @@
-from flask import render_template, flash, redirect, url_for, request, Blueprint, current_app
+from flask import render_template, flash, redirect, url_for, request, Blueprint, current_app, make_response, \
+    Response, stream_with_context, abort, g
 from flask_login import login_user, login_required, logout_user, current_user
-from werkzeug.security import check_password_hash, generate_password_hash
-from werkzeug.utils import secure_filename
 from . import db
 from .utils import process_phone_number
-from .models import Users, Transactions
-from .forms import UserForm, TransactionForm, LoginForm
-from collections import defaultdict
+from .models import Users, Transactions, ArchivedTransactions
+from .forms import UserForm, TransactionForm, LoginForm, ImportForm, DeleteUserForm, CATEGORY_CHOICES, TYPE_CHOICES
+from .aggregates import dashboard_totals, dashboard_data
+from .events import dashboard_stream, acquire_stream_slot
+from .importer import import_transactions, parse_statement
+from .forecast import get_forecast, HORIZON_MONTHS
+from .avatars import submit_avatar, DEFAULT_PIC
+from .purge import purge_user
+from .user_admin import user_page, admin_required
+from .search import search_transactions, RESULT_LIMIT
+from .export import export_rows, csv_chunks, jsonl_chunks, gzip_chunks
+from .pagination import parse_filters, transaction_page, PAGE_SIZE
+from .replicas import read_replica
+from .fragments import fragment_cache
+from .analytics import analytics
+from .batch import apply_batch, BatchInProgress
+from .passwords import hash_password, check_password, HashingBusy
 from datetime import datetime
-import os
 import uuid
 
 main = Blueprint('main', __name__)
 
-DEFAULT_PIC = "profile/profile-user.png"
-
 
 @main.route('/user/add', methods=['GET', 'POST'])
 def add_user():
@@ -28,15 +38,6 @@ def add_user():
                 # Process and validate the phone number
                 phone = process_phone_number(form.phone.data)
 
-                # Handle profile picture upload
-                image = request.files.get('profile_pic')
-                if image and image.filename != '':
-                    pic_filename = secure_filename(image.filename)
-                    pic_name = f"profile/{uuid.uuid4()}_{pic_filename}"
-                    image.save(os.path.join(current_app.config['UPLOAD_FOLDER'], pic_name))
-                else:
-                    pic_name = DEFAULT_PIC  # Set to a default image
-
                 # Create and add the new user
                 new_user = Users(
                     id=str(uuid.uuid4()),
@@ -46,21 +47,43 @@ def add_user():
                     email=form.email.data,
                     balance=0,
                     phone=phone,
-                    password_hash=generate_password_hash(form.password.data),
-                    profile_pic=pic_name,
+                    password_hash=hash_password(current_app._get_current_object(), form.password.data),
+                    profile_pic=DEFAULT_PIC,  # Shown until the uploaded picture is processed
                 )
                 db.session.add(new_user)
                 db.session.commit()
 
+                # Handle profile picture upload in the background
+                image = request.files.get('profile_pic')
+                if image and image.filename != '':
+                    try:
+                        submit_avatar(current_app._get_current_object(), new_user.id, image)
+                    except ValueError as e:
+                        flash(str(e), "danger")
+
                 flash("User added successfully!", "success")
                 return redirect(url_for('main.login'))
             except ValueError as e:
                 flash(str(e), "danger")
+            except HashingBusy:
+                flash("We're busy right now - please try again in a moment.", "danger")
+                return render_template("add_user.html", form=form), 503, {'Retry-After': '5'}
         else:
             flash("Email already registered.", "danger")
 
-    our_users = Users.query.order_by(Users.date_added).all()
-    return render_template("add_user.html", form=form, our_users=our_users)
+    return render_template("add_user.html", form=form)
+
+
+# Keyset-paginated user list with prefix search on username or email
+@main.route('/admin/users')
+@login_required
+@admin_required
+def admin_users():
+    q = request.args.get('q', '').strip()
+    field = request.args.get('field', 'username')
+    users, next_cursor = user_page(q, field, request.args.get('after'))
+    return render_template("admin_users.html", users=users, next_cursor=next_cursor, q=q, field=field,
+                           delete_form=DeleteUserForm())
 
 
 # Create login page
@@ -70,8 +93,19 @@ def login():
     if form.validate_on_submit():
         user = Users.query.filter_by(username=form.username.data).first()
         if user:
-            # Check the hash
-            if check_password_hash(user.password_hash, form.password.data):
+            # Check the hash in the hashing pool
+            try:
+                matches, new_hash = check_password(current_app._get_current_object(), user.password_hash,
+                                                   form.password.data)
+            except HashingBusy:
+                flash("Too many sign-ins right now - please try again in a moment.")
+                return render_template("login.html", form=form), 503, {'Retry-After': '5'}
+            if matches:
+                if new_hash:
+                    # Upgrade hashes made with older parameters while we have the plain password
+                    db.session.execute(db.update(Users).where(Users.id == user.id).values(password_hash=new_hash))
+                    db.session.commit()
+                    Users.data_changed(user.id)
                 login_user(user)
                 return redirect(url_for("main.index"))
             else:
@@ -92,57 +126,122 @@ def logout():
 
 @main.route('/get_latest_data')
 @login_required
+@read_replica
 def get_latest_data():
-    user = Users.query.get(current_user.id)
-    monthly_data = defaultdict(lambda: {'income': 0, 'expense': 0})
-
-    for transaction in user.transactions:
-        month = transaction.date_added.month - 1  # Adjusting month to be 0-indexed for use in charts
-        if transaction.trans_type.lower() == 'income':
-            monthly_data[month]['income'] += transaction.amount
-        elif transaction.trans_type.lower() == 'expense':
-            monthly_data[month]['expense'] += transaction.amount
-
-    data = {
-        'balance': user.balance,
-        'income_data': [monthly_data[month]['income'] for month in range(12)],
-        'expense_data': [monthly_data[month]['expense'] for month in range(12)],
-        'income_sum': sum([monthly_data[month]['income'] for month in range(12)]),
-        'expense_sum': sum([monthly_data[month]['expense'] for month in range(12)]),
-    }
-    return data
+    user = current_user
+
+    # The ETag covers data_version and the year, so a match skips the aggregation entirely
+    if request.if_none_match.contains(user.dashboard_etag):
+        return '', 304
+
+    response = make_response(dashboard_data(user))
+    response.set_etag(user.dashboard_etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# Full-text search over descriptions and categories, with category and amount-range facets
+@main.route("/api/transactions/search")
+@login_required
+def api_search_transactions():
+    transactions = search_transactions(current_user, request.args.get('q', ''),
+                                       category=request.args.get('category') or None,
+                                       min_amount=request.args.get('min_amount', type=int),
+                                       max_amount=request.args.get('max_amount', type=int),
+                                       limit=request.args.get('limit', RESULT_LIMIT, type=int))
+    results = []
+    for transaction in transactions:
+        result = transaction.to_dict()
+        # Archived hits are read-only and have no detail page, so they carry no link
+        result['archived'] = isinstance(transaction, ArchivedTransactions)
+        if not result['archived']:
+            result['url'] = url_for('main.transaction_detail', transaction_id=transaction.id)
+        results.append(result)
+    return {'transactions': results}
+
+
+# Category breakdown and totals for a date range, and month-by-month totals of whole years to compare
+@main.route('/api/analytics')
+@login_required
+@read_replica
+def api_analytics():
+    try:
+        filters = parse_filters(request.args)
+        years = [int(year) for year in request.args.get('years', '').split(',') if year.strip()]
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    if len(years) > 10 or any(not 1970 <= year <= 2100 for year in years):
+        return {'error': "years must be up to 10 comma-separated years between 1970 and 2100"}, 400
+    return analytics(current_user, years=years, **filters)
+
+
+# Cash-flow forecast for the next months (?months=N, up to 24)
+@main.route('/api/forecast')
+@login_required
+def api_forecast():
+    return get_forecast(current_user, request.args.get('months', HORIZON_MONTHS, type=int))
+
+
+# Server-Sent Events stream that pushes the dashboard data whenever the user's transactions change
+@main.route('/events')
+@login_required
+def events():
+    # 204 tells EventSource not to reconnect, so the page falls back to polling
+    if not current_app.config['SSE_ENABLED']:
+        return '', 204
+    release = acquire_stream_slot(current_app)
+    if release is None:
+        return '', 204
+
+    stream = dashboard_stream(current_user.id, request.headers.get('Last-Event-ID'), dashboard_data,
+                              current_app.config['SSE_MAX_STREAM_SECONDS'],
+                              current_app.config['SSE_HEARTBEAT_SECONDS'],
+                              current_app.config['SSE_RETRY_MS'])
+    response = Response(stream_with_context(stream), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs when the server closes the response, even if the stream never started
+    response.call_on_close(release)
+    return response
 
 
 # Create route decorators
 @main.route("/")
 @login_required
+@read_replica
 def index():
-    # user_transactions = Transactions.query.order_by(Transactions.date_added.desc()).limit(limit=4)
-    user_transactions = Transactions.query.order_by(Transactions.date_added.desc()).where(
-        Transactions.user_id == current_user.id).limit(limit=4)
-    user = Users.query.get(current_user.id)
-
-    # Group transactions by month and type
-    monthly_data = defaultdict(lambda: {'income': 0, 'expense': 0, 'balance': user.balance})
-
-    for transaction in user.transactions:
-        month = transaction.date_added.month
-        if transaction.trans_type.lower() == 'income':
-            monthly_data[month]['income'] += transaction.amount
-        elif transaction.trans_type.lower() == 'expense':
-            monthly_data[month]['expense'] += transaction.amount
-
-    # Prepare data for the chart
-    income_data = [monthly_data.get(month, {}).get('income', 0) for month in range(1, 13)]
-    expense_data = [monthly_data.get(month, {}).get('expense', 0) for month in range(1, 13)]
-    balance_data = [monthly_data[month]['balance'] for month in range(1, 13)]
-
-    # Detect overspending by comparing expenses and income
-    overspending = any(monthly_data[month]['expense'] > monthly_data[month]['income'] for month in range(1, 13))
+    user = current_user
+
+    # Balance, chart and recent transactions are cached fragments, rendered by the builders below
+
+    # Detect overspending in the months ahead
+    forecast = get_forecast(user)
+    overspending = bool(forecast['overspending'])
     date = datetime.now().year
-    return render_template("index.html", user_transactions=user_transactions, date=date,
-                           income_data=income_data, expense_data=expense_data, balance=balance_data, user=user,
-                           overspending=overspending)
+    return render_template("index.html", forecast=forecast, date=date, user=user, overspending=overspending,
+                           charts=True)
+
+
+def current_totals(user):
+    # This year's monthly totals from the rollup, including projected recurring transactions,
+    # computed at most once per request however many fragments need them
+    if 'dashboard_totals' not in g:
+        g.dashboard_totals = dashboard_totals(user, datetime.now().year)
+    return g.dashboard_totals
+
+
+@fragment_cache.fragment('balance_snippet.html')
+def balance_fragment(user):
+    return dict(projected_balance=current_totals(user).projected_balance)
+
+
+@fragment_cache.fragment('chart_snippet.html')
+def chart_fragment(user):
+    return dict(chart_data=dashboard_data(user, current_totals(user)))
+
+
+@fragment_cache.fragment('rt_snippet.html')
+def recent_transactions_fragment(user):
+    return dict(user_transactions=Transactions.for_user(user.id).limit(limit=4))
 
 
 @main.route("/help-center")
@@ -162,7 +261,7 @@ def profile():
 @login_required
 def settings():
     form = UserForm()
-    user_to_update = Users.query.get_or_404(current_user.id)
+    user_to_update = current_user
 
     if request.method == "POST":
         user_to_update.first_name = form.first_name.data
@@ -175,15 +274,15 @@ def settings():
             profile_pic_file = request.files['profile_pic']
 
             if profile_pic_file and profile_pic_file.filename != '':
-                # Handle new profile picture upload
-                pic_filename = secure_filename(profile_pic_file.filename)
-                pic_name = "profile/" + str(current_user.id) + '_' + pic_filename
-                pic_path = os.path.join(current_app.config['UPLOAD_FOLDER'], pic_name)
-                profile_pic_file.save(pic_path)
-                user_to_update.profile_pic = pic_name
+                # Resized in the background; the current picture stays until it is ready
+                try:
+                    submit_avatar(current_app._get_current_object(), current_user.id, profile_pic_file)
+                except ValueError as e:
+                    flash(str(e), "danger")
 
         try:
             db.session.commit()
+            Users.data_changed(user_to_update.id)
             flash("Profile Updated Successfully", "success")
             return redirect(url_for('main.settings'))
         except Exception as e:
@@ -210,8 +309,10 @@ def transaction_detail(transaction_id):
     if request.method == "POST":
         if current_user.id == transaction.users.id:
             try:
-                Transactions.update_transaction(transaction, form)
-                flash("Transaction Updated Successfully")
+                if Transactions.update_transaction(transaction, form):
+                    flash("Transaction Updated Successfully")
+                else:
+                    flash("This transaction was changed or deleted in the meantime - please check it and try again")
                 return redirect(url_for('main.wallet'))
             except Exception as e:
                 db.session.rollback()
@@ -233,33 +334,53 @@ def transaction_detail(transaction_id):
 
 @main.route("/wallet")
 @login_required
+@read_replica
 def wallet():
-    user = Users.query.get(current_user.id)
-    user_transactions = Transactions.query.order_by(Transactions.date_added.desc()).where(
-        Transactions.user_id == current_user.id)
-
-    # Group transactions by month and type
-    monthly_data = defaultdict(lambda: {'income': 0, 'expense': 0, 'balance': user.balance})
-
-    for transaction in user.transactions:
-        month = transaction.date_added.month
-        if transaction.trans_type.lower() == 'income':
-            monthly_data[month]['income'] += transaction.amount
-        elif transaction.trans_type.lower() == 'expense':
-            monthly_data[month]['expense'] += transaction.amount
-
-    # Prepare data for the chart
-    income_data = [monthly_data.get(month, {}).get('income', 0) for month in range(1, 13)]
-    expense_data = [monthly_data.get(month, {}).get('expense', 0) for month in range(1, 13)]
-    balance_data = [monthly_data[month]['balance'] for month in range(1, 13)]
-
-    # Detect overspending by comparing expenses and income
-    overspending = any(monthly_data[month]['expense'] > monthly_data[month]['income'] for month in range(1, 13))
+    user = current_user
+    try:
+        filters = parse_filters(request.args)
+    except ValueError as e:
+        flash(str(e))
+        filters = parse_filters({})
+    user_transactions, next_cursor = transaction_page(current_user.id, **filters)
+
+    totals = current_totals(user)
+
+    # Prepare data for the monthly summary
+    income_data = totals.income
+    expense_data = totals.expense
+    balance_data = [user.balance] * 12
+
+    # Detect overspending this year
+    overspending = totals.overspending
     date = datetime.now().year
     month = datetime.now().month
     return render_template("wallet.html", user_transactions=user_transactions, date=date,
                            income_data=income_data, expense_data=expense_data, balance=balance_data, user=user,
-                           overspending=overspending, month=month)
+                           overspending=overspending, month=month, charts=True,
+                           next_cursor=next_cursor, filters=request.args, category_choices=CATEGORY_CHOICES[1:],
+                           type_choices=TYPE_CHOICES[1:])
+
+
+# Keyset-paginated transaction list for the wallet's infinite scroll
+@main.route("/api/transactions")
+@login_required
+@read_replica
+def api_transactions():
+    try:
+        filters = parse_filters(request.args)
+        transactions, next_cursor = transaction_page(current_user.id, after=request.args.get('after'),
+                                                     limit=request.args.get('limit', PAGE_SIZE, type=int),
+                                                     **filters)
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+    return {
+        'transactions': [dict(transaction.to_dict(),
+                              url=url_for('main.transaction_detail', transaction_id=transaction.id))
+                         for transaction in transactions],
+        'next_cursor': next_cursor,
+    }
 
 
 @main.route("/add-transaction", methods=['GET', 'POST'])
@@ -277,36 +398,100 @@ def add_transaction_detail():
     return render_template('transaction_form.html', form=form, date=date)
 
 
+# Sync many client-side changes in one request; see app.batch.apply_batch for the format.
+# Only JSON bodies are accepted, which a cross-site form cannot send, so no CSRF token is needed.
+@main.route("/api/transactions:batch", methods=['POST'])
+@login_required
+def api_transactions_batch():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return {'error': "Expected a JSON object with an operations list"}, 400
+    try:
+        results = apply_batch(current_user, payload.get('operations'))
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    except BatchInProgress:
+        return {'error': "Some of these keys are being applied by another request; retry shortly"}, 409, \
+            {'Retry-After': '1'}
+    return {'results': results, 'balance': current_user.balance}
+
+
+EXPORT_FORMATS = {
+    'csv': (csv_chunks, 'text/csv'),
+    'jsonl': (jsonl_chunks, 'application/x-ndjson'),
+}
+
+
+# Stream the user's transaction history without loading it into memory
+@main.route("/export/transactions.<string:file_format>")
+@login_required
+@read_replica
+def export_transactions(file_format):
+    if file_format not in EXPORT_FORMATS:
+        abort(404)
+    try:
+        filters = parse_filters(request.args)
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+    serialize, mimetype = EXPORT_FORMATS[file_format]
+    chunks = serialize(export_rows(current_user.id, **filters))
+    headers = {'Content-Disposition': f'attachment; filename=transactions.{file_format}', 'Vary': 'Accept-Encoding'}
+    if 'gzip' in request.accept_encodings:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+
+# Bulk import of a CSV or OFX bank statement
+@main.route("/import-transactions", methods=['GET', 'POST'])
+@login_required
+def import_transactions_upload():
+    form = ImportForm()
+    result = None
+    if form.validate_on_submit():
+        statement = form.statement.data
+        try:
+            result = import_transactions(current_user, parse_statement(statement.stream, statement.filename))
+            flash(f"Imported {result.inserted} transactions, {len(result.errors)} rows skipped.")
+        except Exception as e:
+            flash(f"Error!!... There was a problem importing your statement: {str(e)}")
+    date = datetime.now().year
+    return render_template('import_transactions.html', form=form, result=result, date=date)
+
+
 @main.route("/delete/<string:id>")
 @login_required
 def delete(id):
     transaction = Transactions.query.get_or_404(id)
     if current_user.id == transaction.users.id:
         try:
+            # False when a repeated request (e.g. a double-click) finds it already deleted
             Transactions.delete_transaction(transaction)
-            return redirect(url_for('main.wallet'))
         except Exception as e:
             db.session.rollback()
             flash(f"Error!!... There was a problem deleting your transaction: {str(e)}")
+        return redirect(url_for('main.wallet'))
     else:
         flash(f"You Are Not Authorized To Perform This Action")
         return redirect(url_for('main.wallet'))
 
 
-@main.route("/delete_user/<string:id>")
+@main.route("/delete_user/<string:id>", methods=["POST"])
+@login_required
+@admin_required
 def delete_user(id):
-    delete_users = Users.query.get_or_404(id)
-    user_transactions = Transactions.query.where(Transactions.user_id == id)
+    # A POST with the form's CSRF token, so a link or another site can't trigger it
+    if not DeleteUserForm().validate_on_submit():
+        abort(400)
+    Users.query.get_or_404(id)
     try:
-        for tran in user_transactions:
-            db.session.delete(tran)
-        db.session.delete(delete_users)
-        db.session.commit()
-        return redirect(url_for('main.add_user'))
+        purge_user(id)
+        return redirect(url_for('main.admin_users'))
     except Exception as e:
         db.session.rollback()
         flash(f"Error!!... There was a problem deleting your record: {str(e)}")
-        return redirect(url_for('main.add_user'))
+        return redirect(url_for('main.admin_users'))
 
 
 # Create Custom Error Pages
@@ -0,0 +1,159 @@
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from sqlalchemy import func, literal_column, text
+from . import db
+from .models import Transactions, ArchivedTransactions
+
+RESULT_LIMIT = 50
+MAX_RESULT_LIMIT = 200
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+# Created by migrations 7a5f0e2c9b13 and 3c8d5e1f7a26 on MySQL and PostgreSQL only; skipped by autogenerate
+SEARCH_INDEXES = {'ft_transactions_text', 'ix_transactions_search',
+                  'ft_transactions_archive_text', 'ix_transactions_archive_search'}
+
+
+def pg_document(model):
+    # Must match the expression of the GIN index for the planner to use it
+    return func.to_tsvector(literal_column("'simple'"), func.coalesce(model.description, '') + ' ' + model.category)
+
+
+def tokenize(value):
+    return TOKEN.findall((value or '').lower())
+
+
+class InvertedIndex:
+    """Per-user in-memory token index used where the database has no full-text search (SQLite).
+
+    Each user's index records the data_version it reflects. Transaction
+    writes, batches and imports update it in place through
+    Transactions.update_caches; any other change (writes in another worker,
+    archiving) leaves the version behind and the index is rebuilt on the next
+    search. At most max_users indexes are kept, least recently used first out.
+    """
+
+    def __init__(self, max_users=64):
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+
+    @staticmethod
+    def _add(entry, transaction_id, description, category, amount, date_added):
+        tokens = set(tokenize(description) + tokenize(category))
+        entry['rows'][transaction_id] = (category, amount, date_added, tokens)
+        for token in tokens:
+            entry['postings'][token].add(transaction_id)
+
+    def _build(self, user_id, version):
+        entry = {'version': version, 'postings': defaultdict(set), 'rows': {}}
+        # Archived rows are indexed too; archiving moves rows without changing what a search finds
+        for model in (Transactions, ArchivedTransactions):
+            query = db.session.query(model.id, model.description, model.category, model.amount, model.date_added) \
+                .filter(model.user_id == user_id)
+            for row in query:
+                self._add(entry, *row)
+        return entry
+
+    def get(self, user_id, version):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and entry['version'] == version:
+                self._users.move_to_end(user_id)
+                return entry
+        entry = self._build(user_id, version)
+        with self._lock:
+            self._users[user_id] = entry
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return entry
+
+    def apply(self, user_id, old_version, new_version, added=(), removed=()):
+        """Apply one write to a user's index if it is current, otherwise leave it to be rebuilt.
+
+        added holds CachedRow tuples, removed holds ids.
+        """
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None or entry['version'] != old_version:
+                return
+            for transaction_id in removed:
+                row = entry['rows'].pop(transaction_id, None)
+                for token in row[3] if row else ():
+                    entry['postings'][token].discard(transaction_id)
+            for row in added:
+                self._add(entry, row.id, row.description, row.category, row.amount, row.date_added)
+            entry['version'] = new_version
+
+    def search(self, user, q, category=None, min_amount=None, max_amount=None, limit=RESULT_LIMIT):
+        entry = self.get(user.id, user.data_version)
+        tokens = tokenize(q)
+        # apply() changes postings and rows in place, so resolve the ids under the same lock
+        with self._lock:
+            postings = entry['postings']
+            matches = None
+            for position, token in enumerate(tokens):
+                if position == len(tokens) - 1:
+                    # Prefix match on the last word so results appear while typing
+                    ids = set().union(*(ids for t, ids in postings.items() if t.startswith(token)))
+                else:
+                    ids = set(postings.get(token, ()))
+                matches = ids if matches is None else matches & ids
+            if not matches:
+                return []
+
+            rows = entry['rows']
+            hits = [transaction_id for transaction_id in matches
+                    if transaction_id in rows
+                    and (category is None or rows[transaction_id][0] == category)
+                    and (min_amount is None or rows[transaction_id][1] >= min_amount)
+                    and (max_amount is None or rows[transaction_id][1] <= max_amount)]
+            hits.sort(key=lambda transaction_id: (rows[transaction_id][2], transaction_id), reverse=True)
+            hits = hits[:limit]
+
+        found = {}
+        for model in (Transactions, ArchivedTransactions):
+            missing = [transaction_id for transaction_id in hits if transaction_id not in found]
+            if missing:
+                found.update((transaction.id, transaction) for transaction in model.query.filter(model.id.in_(missing)))
+        return [found[transaction_id] for transaction_id in hits if transaction_id in found]
+
+
+transaction_index = InvertedIndex()
+
+
+def database_search(user, q, category=None, min_amount=None, max_amount=None, limit=RESULT_LIMIT,
+                    model=Transactions):
+    dialect = db.engine.dialect.name
+    table = model.__tablename__
+    query = model.query.filter(model.user_id == user.id)
+    if dialect in ('mysql', 'mariadb'):
+        # Boolean mode with a trailing * on each word gives prefix matching like the fallback
+        terms = ' '.join(f"+{token}*" for token in tokenize(q))
+        query = query.filter(text(f"MATCH ({table}.description, {table}.category) "
+                                  "AGAINST (:terms IN BOOLEAN MODE)").bindparams(terms=terms))
+    else:
+        terms = ' & '.join(f"{token}:*" for token in tokenize(q))
+        query = query.filter(pg_document(model).op('@@')(func.to_tsquery(literal_column("'simple'"), terms)))
+
+    if category:
+        query = query.filter(model.category == category)
+    if min_amount is not None:
+        query = query.filter(model.amount >= min_amount)
+    if max_amount is not None:
+        query = query.filter(model.amount <= max_amount)
+    return query.order_by(model.date_added.desc(), model.id.desc()).limit(limit).all()
+
+
+def search_transactions(user, q, category=None, min_amount=None, max_amount=None, limit=RESULT_LIMIT):
+    if not tokenize(q):
+        return []
+    limit = max(1, min(limit, MAX_RESULT_LIMIT))
+    if db.engine.dialect.name in ('mysql', 'mariadb', 'postgresql'):
+        results = database_search(user, q, category, min_amount, max_amount, limit)
+        if len(results) < limit:
+            # Live matches first, then archived ones (which predate the archive cutoff) to fill the page
+            results += database_search(user, q, category, min_amount, max_amount, limit - len(results),
+                                       model=ArchivedTransactions)
+        return results
+    return transaction_index.search(user, q, category, min_amount, max_amount, limit)
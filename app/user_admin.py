@@ -0,0 +1,33 @@
+from functools import wraps
+from flask import abort
+from flask_login import current_user
+from .models import Users
+
+PAGE_SIZE = 50
+SEARCH_FIELDS = ('username', 'email')
+
+
+def admin_required(view):
+    """Refuse the view with a 403 unless the logged-in user is in ADMIN_USERNAMES; use under login_required."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_user.is_admin:
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def user_page(q=None, field='username', after=None, limit=PAGE_SIZE):
+    """Return (users, next_cursor) ordered by the search field, keyed on its unique index."""
+    column = getattr(Users, field if field in SEARCH_FIELDS else 'username')
+    query = Users.query
+    if q:
+        # LIKE 'abc%' (with % and _ escaped) is an index range scan under the column's own collation;
+        # PostgreSQL serves it from the text_pattern_ops indexes of migration 4e7a1c9d3b58
+        query = query.filter(column.startswith(q, autoescape=True))
+    if after:
+        query = query.filter(column > after)
+
+    users = query.order_by(column).limit(limit + 1).all()
+    next_cursor = getattr(users[limit - 1], column.key) if len(users) > limit else None
+    return users[:limit], next_cursor
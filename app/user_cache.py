@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy.orm import make_transient_to_detached
+from . import db
+
+
+class UserCache:
+    """Bounded, TTL'd cache of Users column values shared by the requests of one worker.
+
+    Only plain column values are cached. load() turns them back into a Users
+    instance attached to the current session without a SELECT, so within a
+    request every lookup of that user hits the session's identity map.
+    Entries are dropped when the user's row changes in this worker; the TTL
+    bounds how long a change made by another worker can go unnoticed.
+
+    The VOLATILE columns change on every transaction write, often in another
+    worker, and drive the ETags and cache keys, so they are never cached:
+    they are left unloaded and fetched together by primary key on first access.
+    """
+
+    VOLATILE = ('balance', 'data_version')
+
+    def __init__(self, maxsize=1024, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('USER_CACHE_SIZE', self.maxsize)
+        self.ttl = app.config.get('USER_CACHE_TTL', self.ttl)
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires, values = entry
+            if expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return values
+
+    def set(self, user_id, values):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def load(self, model, user_id):
+        values = self.get(user_id)
+        if values is None:
+            user = db.session.get(model, user_id)
+            if user is not None:
+                self.set(user_id, {column.key: getattr(user, column.key) for column in model.__table__.columns
+                                   if column.key not in self.VOLATILE})
+            return user
+
+        user = model(**values)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+
+user_cache = UserCache()
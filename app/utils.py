@@ -1,8 +1,7 @@
-import phonenumbers
-from phonenumbers import *
-
-
 def process_phone_number(raw_phone_number, default_region='NG'):
+    # phonenumbers loads its metadata tables on import, so only pay for it when a number is entered
+    import phonenumbers
+
     try:
         # Parse the phone number
         phone_number = phonenumbers.parse(raw_phone_number, default_region)
@@ -11,6 +10,6 @@ def process_phone_number(raw_phone_number, default_region='NG'):
         if not phonenumbers.is_valid_number(phone_number):
             raise ValueError("Invalid phone number")
 
-        return phonenumbers.format_number(phone_number, PhoneNumberFormat.E164)
-    except NumberParseException as e:
+        return phonenumbers.format_number(phone_number, phonenumbers.PhoneNumberFormat.E164)
+    except phonenumbers.NumberParseException as e:
         raise ValueError(f"Error parsing phone number: {e}")
@@ -0,0 +1,60 @@
+"""Synthetic users and transactions for benchmarking, drawn from the real form choices."""
+import random
+import uuid
+from datetime import datetime, timedelta
+from werkzeug.security import generate_password_hash
+from app import db
+from app.aggregates import rebuild_monthly_summary, reconcile_balances
+from app.forms import TYPE_CHOICES, CATEGORY_CHOICES, RECURRING_CHOICES, DURATION_CHOICES
+from app.models import Users, Transactions
+
+PASSWORD = "benchmark-password"
+TYPES = [value for value, _ in TYPE_CHOICES if value is not None]
+CATEGORIES = [value for value, _ in CATEGORY_CHOICES if value is not None]
+FREQUENCIES = [value for value, _ in RECURRING_CHOICES if value is not None]
+DURATIONS = [value for value, _ in DURATION_CHOICES if value is not None]
+WORDS = ["rent", "salary", "coffee", "fuel", "groceries", "gift", "school", "repair", "flight", "bonus"]
+
+
+def username(index):
+    return f"bench{index:05d}"
+
+
+def generate(users, transactions_per_user, days=730, recurring_ratio=0.1, seed=1, batch_size=5000):
+    """Insert `users` users with `transactions_per_user` transactions each, then build rollups and balances."""
+    rng = random.Random(seed)
+    # Hashing is deliberately slow, so every user shares one hash
+    password_hash = generate_password_hash(PASSWORD)
+    now = datetime.now()
+
+    user_rows = [dict(id=str(uuid.UUID(int=rng.getrandbits(128))), username=username(index),
+                      first_name="Bench", last_name=f"User {index}", email=f"{username(index)}@example.com",
+                      phone="+2348030000000", balance=0, password_hash=password_hash, date_added=now)
+                 for index in range(users)]
+    db.session.execute(db.insert(Users), user_rows)
+
+    batch = []
+    for user in user_rows:
+        for _ in range(transactions_per_user):
+            recurring = rng.random() < recurring_ratio
+            batch.append(dict(
+                id=str(uuid.UUID(int=rng.getrandbits(128))),
+                amount=rng.randint(1, 5000),
+                trans_type=rng.choice(TYPES),
+                category=rng.choice(CATEGORIES),
+                transaction_frequency=rng.choice(FREQUENCIES) if recurring else 'Once',
+                duration=rng.choice(DURATIONS[1:]) if recurring else 0,
+                description=" ".join(rng.sample(WORDS, 2)),
+                date_added=now - timedelta(seconds=rng.randint(0, days * 86400)),
+                user_id=user['id'],
+            ))
+            if len(batch) >= batch_size:
+                db.session.execute(db.insert(Transactions), batch)
+                batch = []
+    if batch:
+        db.session.execute(db.insert(Transactions), batch)
+    db.session.commit()
+
+    rebuild_monthly_summary()
+    reconcile_balances()
+    return [user['username'] for user in user_rows]
@@ -0,0 +1,127 @@
+"""Dashboard latency while a storm of logins hashes passwords, with inline hashing and with the hashing pool.
+
+Requests arrive at a fixed rate and are served by --threads threads, like one
+gthread worker; dashboard latency includes the time spent waiting for a thread.
+
+    python -m benchmarks.login_storm --hash-workers 0 2 --output storm.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.run import percentile, git_revision
+
+
+def storm(args):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='finance-bench-'), 'bench.db')}"
+    os.environ['PASSWORD_HASH_WORKERS'] = str(args.hash_workers)
+
+    from flask_migrate import upgrade
+    from app import create_app
+    from app.models import Users
+    from benchmarks.datagen import generate, PASSWORD
+
+    app = create_app()
+    app.config.update(WTF_CSRF_ENABLED=False, SSE_ENABLED=False)
+    with app.app_context():
+        upgrade(directory=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations'))
+        usernames = generate(args.users, args.transactions)
+        user_ids = [user.id for user in Users.query.order_by(Users.username)]
+
+    def dashboard(number):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = user_ids[number % len(user_ids)]
+            session['_fresh'] = True
+        return client.get('/').status_code
+
+    def login(number):
+        return app.test_client().post('/login', data=dict(username=usernames[number % len(usernames)],
+                                                          password=PASSWORD)).status_code
+
+    # Warm the hashing pool, caches and templates before measuring
+    for number in range(len(user_ids)):
+        dashboard(number)
+    login(0)
+
+    results = {'dashboard': [], 'login': []}
+    statuses = {'dashboard': {}, 'login': {}}
+    lock = threading.Lock()
+
+    def timed(kind, job, number, queued):
+        status = job(number)
+        with lock:
+            results[kind].append((time.perf_counter() - queued) * 1000)
+            statuses[kind][status] = statuses[kind].get(status, 0) + 1
+
+    total = args.logins + args.dashboards
+    every = max(1, round(total / args.dashboards))
+    with ThreadPoolExecutor(max_workers=args.threads) as threads:
+        started = time.perf_counter()
+        for number in range(total):
+            # Spread the dashboard views evenly through the login storm
+            kind, job = ('dashboard', dashboard) if number % every == 0 else ('login', login)
+            threads.submit(timed, kind, job, number, time.perf_counter())
+            time.sleep(max(0.0, started + (number + 1) / args.rate - time.perf_counter()))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'hash_workers': args.hash_workers,
+        'seconds': round(elapsed, 2),
+        'results': {kind: {'requests': len(samples),
+                           'statuses': {str(status): count for status, count in sorted(statuses[kind].items())},
+                           'p50_ms': round(percentile(samples, 50), 1),
+                           'p95_ms': round(percentile(samples, 95), 1),
+                           'p99_ms': round(percentile(samples, 99), 1)}
+                    for kind, samples in results.items()},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--hash-workers', type=int, nargs='+', default=[0, 2],
+                        help="PASSWORD_HASH_WORKERS values to compare; 0 hashes inline.")
+    parser.add_argument('--threads', type=int, default=8, help="Request threads, as in the Procfile.")
+    parser.add_argument('--rate', type=float, default=100, help="Requests per second.")
+    parser.add_argument('--logins', type=int, default=600)
+    parser.add_argument('--dashboards', type=int, default=200)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--transactions', type=int, default=500, help="Transactions per user.")
+    parser.add_argument('--output', help="Write the JSON results here instead of stdout.")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        args.hash_workers = args.hash_workers[0]
+        print(json.dumps(storm(args)))
+        return
+
+    # Each setting runs in a fresh interpreter so no hashing pool or cache carries over
+    runs = []
+    for hash_workers in args.hash_workers:
+        command = [sys.executable, '-m', 'benchmarks.login_storm', '--child', '--hash-workers', str(hash_workers),
+                   '--threads', str(args.threads), '--rate', str(args.rate), '--logins', str(args.logins),
+                   '--dashboards', str(args.dashboards), '--users', str(args.users),
+                   '--transactions', str(args.transactions)]
+        result = subprocess.run(command, capture_output=True, text=True, check=True)
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    output = json.dumps({'revision': git_revision(), 'python': sys.version.split()[0],
+                         'params': {'threads': args.threads, 'rate': args.rate, 'logins': args.logins,
+                                    'dashboards': args.dashboards},
+                         'runs': runs}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
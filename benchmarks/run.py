@@ -0,0 +1,166 @@
+"""Latency, query-count and memory benchmark for the main pages.
+
+Builds a throwaway SQLite database (or uses --database) through the
+migrations, fills it with synthetic data and drives the endpoints through
+the Flask test client. Results are written as JSON so runs from different
+commits can be compared:
+
+    python -m benchmarks.run --users 20 --transactions 5000 --output before.json
+    python -m benchmarks.run --users 20 --transactions 5000 --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ENDPOINTS = ('index', 'wallet', 'get_latest_data', 'add_transaction_detail', 'login')
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self)
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+def make_request(client, endpoint, user):
+    if endpoint == 'index':
+        return client.get('/')
+    if endpoint == 'wallet':
+        return client.get('/wallet')
+    if endpoint == 'get_latest_data':
+        return client.get('/get_latest_data')
+    if endpoint == 'add_transaction_detail':
+        return client.post('/add-transaction', data=dict(amount=42, trans_type='Expense', category='Groceries',
+                                                          transaction_frequency='Once', duration='0',
+                                                          description='benchmark'))
+    if endpoint == 'login':
+        from benchmarks.datagen import PASSWORD
+        return client.post('/login', data=dict(username=user, password=PASSWORD))
+    raise ValueError(endpoint)
+
+
+def measure(app, engine, endpoint, users, requests, warmup):
+    counter = QueryCounter(engine)
+    clients = {}
+    for user in users:
+        client = app.test_client()
+        make_request(client, 'login', user)
+        clients[user] = client
+
+    latencies, queries = [], []
+    tracemalloc.start()
+    for number in range(warmup + requests):
+        user = users[number % len(users)]
+        counter.count = 0
+        started = time.perf_counter()
+        response = make_request(clients[user], endpoint, user)
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise RuntimeError(f"{endpoint} returned {response.status_code}")
+        if number >= warmup:
+            latencies.append(elapsed * 1000)
+            queries.append(counter.count)
+        if number == warmup - 1:
+            tracemalloc.reset_peak()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'requests': requests,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'mean_ms': round(statistics.fmean(latencies), 3),
+        'queries_per_request': round(statistics.fmean(queries), 2),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline):
+    print(f"{'endpoint':<24}{'metric':<22}{'baseline':>12}{'current':>12}{'change':>10}")
+    for endpoint, metrics in results['results'].items():
+        before = baseline.get('results', {}).get(endpoint)
+        if not before:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request', 'peak_memory_kb'):
+            old, new = before[metric], metrics[metric]
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"{endpoint:<24}{metric:<22}{old:>12}{new:>12}{change:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--transactions', type=int, default=1000, help="Transactions per user.")
+    parser.add_argument('--requests', type=int, default=200, help="Measured requests per endpoint.")
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument('--database', help="SQLAlchemy URL of an empty database; a temporary SQLite file by default.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="Write the JSON results here instead of stdout.")
+    parser.add_argument('--compare', help="Previous JSON results to print a comparison against.")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='finance-bench-')
+    os.environ['DATABASE_URL'] = args.database or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    from flask_migrate import upgrade
+    from app import create_app, db
+    from benchmarks.datagen import generate
+
+    app = create_app()
+    app.config.update(WTF_CSRF_ENABLED=False, SSE_ENABLED=False)
+    with app.app_context():
+        upgrade(directory=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations'))
+        started = time.perf_counter()
+        users = generate(args.users, args.transactions, seed=args.seed)
+        generate_seconds = time.perf_counter() - started
+        engine = db.engine
+
+    results = {
+        'revision': git_revision(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'database': engine.dialect.name,
+        'params': {'users': args.users, 'transactions_per_user': args.transactions, 'requests': args.requests,
+                   'warmup': args.warmup, 'seed': args.seed},
+        'generate_seconds': round(generate_seconds, 2),
+        'results': {endpoint: measure(app, engine, endpoint, users, args.requests, args.warmup)
+                    for endpoint in args.endpoints},
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
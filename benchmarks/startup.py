@@ -0,0 +1,84 @@
+"""Worker startup time: importing the app, create_app() and the first request, each in a fresh interpreter.
+
+    python -m benchmarks.startup --runs 10 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.run import percentile, git_revision
+
+# Runs in a fresh interpreter and prints its timings as JSON
+PROBE = """
+import json, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+response = app.test_client().get('/login')
+assert response.status_code == 200, response.status_code
+first = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000, 'create_app_ms': (created - imported) * 1000,
+                  'first_request_ms': (first - created) * 1000, 'total_ms': (first - started) * 1000}))
+"""
+
+
+def slowest_imports(env, count):
+    """Modules with the largest cumulative import time, from python -X importtime."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'from app import create_app; create_app()'],
+                            env=env, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Only top-level entries of this package's own imports are interesting
+        if name.startswith('  ') and not name.startswith('    '):
+            rows.append((name.strip(), int(cumulative) / 1000))
+    rows.sort(key=lambda row: row[1], reverse=True)
+    return [{'module': name, 'cumulative_ms': round(ms, 1)} for name, ms in rows[:count]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=15, help="How many of the slowest imports to list.")
+    parser.add_argument('--output', help="Write the JSON results here instead of stdout.")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='finance-bench-'), 'bench.db')}")
+
+    samples = []
+    for _ in range(args.runs):
+        result = subprocess.run([sys.executable, '-c', PROBE], env=env, capture_output=True, text=True, check=True)
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    results = {
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'runs': args.runs,
+        'results': {
+            phase: {'p50_ms': round(percentile([s[phase] for s in samples], 50), 1),
+                    'p95_ms': round(percentile([s[phase] for s in samples], 95), 1),
+                    'mean_ms': round(statistics.fmean(s[phase] for s in samples), 1)}
+            for phase in ('import_ms', 'create_app_ms', 'first_request_ms', 'total_ms')
+        },
+        'slowest_imports': slowest_imports(env, args.top),
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
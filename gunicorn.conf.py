@@ -0,0 +1,32 @@
+import gc
+import os
+
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Import the app once in the master and fork workers from it. The workers share the
+# imported modules' memory copy-on-write and start without importing anything.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+
+def when_ready(server):
+    # Without a build, static files are served unhashed, uncompressed and without long-lived caching
+    manifest = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app', 'static', 'dist', 'manifest.json')
+    if not os.path.exists(manifest):
+        server.log.warning("No static asset manifest at %s; run 'flask assets build' before starting", manifest)
+
+    # Move everything loaded so far out of the garbage collector's view, so collections in
+    # the workers don't touch (and so copy) the pages shared with the master
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Connections opened in the master must not be shared between processes
+    if preload_app:
+        from app import db
+        from run import app
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
@@ -0,0 +1,48 @@
+"""add monthly_summary rollup table
+
+Revision ID: 2b9e6d0a5c31
+Revises: 8f1c2a7d4e10
+Create Date: 2026-10-18 09:14:02.551730
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b9e6d0a5c31'
+down_revision = '8f1c2a7d4e10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('monthly_summary',
+    sa.Column('user_id', sa.VARCHAR(length=60), nullable=False),
+    sa.Column('year', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('month', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('trans_type', sa.String(length=50), nullable=False),
+    sa.Column('amount', sa.BigInteger(), nullable=False),
+    sa.Column('txn_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'year', 'month', 'trans_type')
+    )
+
+    # Fill the rollup from the existing transactions so charts are right straight after the upgrade
+    # (the same grouping as `flask rollups rebuild`; extract() compiles to strftime on SQLite)
+    transactions = sa.table('transactions', sa.column('user_id'), sa.column('amount'),
+                            sa.column('trans_type'), sa.column('date_added', sa.DateTime))
+    summary = sa.table('monthly_summary', sa.column('user_id'), sa.column('year'), sa.column('month'),
+                       sa.column('trans_type'), sa.column('amount'), sa.column('txn_count'))
+    year = sa.extract('year', transactions.c.date_added)
+    month = sa.extract('month', transactions.c.date_added)
+    op.execute(summary.insert().from_select(
+        ['user_id', 'year', 'month', 'trans_type', 'amount', 'txn_count'],
+        sa.select(transactions.c.user_id, year, month, transactions.c.trans_type,
+                  sa.func.sum(transactions.c.amount), sa.func.count())
+        .where(transactions.c.date_added.isnot(None))
+        .group_by(transactions.c.user_id, year, month, transactions.c.trans_type)))
+
+
+def downgrade():
+    op.drop_table('monthly_summary')
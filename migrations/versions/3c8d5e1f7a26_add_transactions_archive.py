@@ -0,0 +1,56 @@
+"""add transactions_archive table for archived transactions
+
+Revision ID: 3c8d5e1f7a26
+Revises: 7a5f0e2c9b13
+Create Date: 2026-10-18 21:14:37.502184
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8d5e1f7a26'
+down_revision = '7a5f0e2c9b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('transactions_archive',
+    sa.Column('id', sa.VARCHAR(length=60), nullable=False),
+    sa.Column('amount', sa.Integer(), nullable=False),
+    sa.Column('trans_type', sa.String(length=50), nullable=False),
+    sa.Column('category', sa.String(length=150), nullable=False),
+    sa.Column('transaction_frequency', sa.String(length=100), nullable=False),
+    sa.Column('description', sa.String(length=25), nullable=True),
+    sa.Column('duration', sa.Integer(), nullable=False),
+    sa.Column('date_added', sa.DateTime(), nullable=True),
+    sa.Column('user_id', sa.VARCHAR(length=60), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('transactions_archive', schema=None) as batch_op:
+        batch_op.create_index('ix_transactions_archive_user_date', ['user_id', 'date_added', 'id'], unique=False)
+
+    # Same full-text indexes as the live table (7a5f0e2c9b13), so search covers archived rows
+    dialect = op.get_bind().dialect.name
+    if dialect in ('mysql', 'mariadb'):
+        op.create_index('ft_transactions_archive_text', 'transactions_archive', ['description', 'category'],
+                        mysql_prefix='FULLTEXT')
+    elif dialect == 'postgresql':
+        op.execute("CREATE INDEX ix_transactions_archive_search ON transactions_archive USING GIN "
+                   "(to_tsvector('simple', coalesce(description, '') || ' ' || category))")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect in ('mysql', 'mariadb'):
+        op.drop_index('ft_transactions_archive_text', table_name='transactions_archive')
+    elif dialect == 'postgresql':
+        op.drop_index('ix_transactions_archive_search', table_name='transactions_archive')
+
+    with op.batch_alter_table('transactions_archive', schema=None) as batch_op:
+        batch_op.drop_index('ix_transactions_archive_user_date')
+
+    op.drop_table('transactions_archive')
@@ -0,0 +1,29 @@
+"""pattern-ops indexes for the admin user prefix search on PostgreSQL
+
+Revision ID: 4e7a1c9d3b58
+Revises: 9d2f4b6a8c17
+Create Date: 2026-10-19 10:12:06.482913
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '4e7a1c9d3b58'
+down_revision = '9d2f4b6a8c17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Under a non-C locale PostgreSQL can't serve LIKE 'abc%' from the unique indexes; MySQL and
+    # SQLite need nothing extra
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("CREATE INDEX ix_users_username_pattern ON users (username text_pattern_ops)")
+        op.execute("CREATE INDEX ix_users_email_pattern ON users (email text_pattern_ops)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_users_email_pattern', table_name='users')
+        op.drop_index('ix_users_username_pattern', table_name='users')
@@ -0,0 +1,29 @@
+"""composite indexes for per-user transaction queries
+
+Revision ID: 5d3a9f8b7e42
+Revises: 2b9e6d0a5c31
+Create Date: 2026-10-18 09:20:37.918164
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d3a9f8b7e42'
+down_revision = '2b9e6d0a5c31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.create_index('ix_transactions_user_date', ['user_id', 'date_added', 'id'], unique=False)
+        batch_op.create_index('ix_transactions_user_type_date', ['user_id', 'trans_type', 'date_added', 'amount'],
+                              unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.drop_index('ix_transactions_user_type_date')
+        batch_op.drop_index('ix_transactions_user_date')
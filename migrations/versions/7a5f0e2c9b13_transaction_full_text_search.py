@@ -0,0 +1,36 @@
+"""full-text search index on transaction descriptions and categories
+
+Revision ID: 7a5f0e2c9b13
+Revises: e8a41c6b2d95
+Create Date: 2026-10-18 15:06:52.430817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a5f0e2c9b13'
+down_revision = 'e8a41c6b2d95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite has no built-in equivalent; the app keeps an in-process index there instead
+    dialect = op.get_bind().dialect.name
+    if dialect in ('mysql', 'mariadb'):
+        op.create_index('ft_transactions_text', 'transactions', ['description', 'category'],
+                        mysql_prefix='FULLTEXT')
+    elif dialect == 'postgresql':
+        # Must match app.search.pg_document() for the planner to use it
+        op.execute("CREATE INDEX ix_transactions_search ON transactions USING GIN "
+                   "(to_tsvector('simple', coalesce(description, '') || ' ' || category))")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect in ('mysql', 'mariadb'):
+        op.drop_index('ft_transactions_text', table_name='transactions')
+    elif dialect == 'postgresql':
+        op.drop_index('ix_transactions_search', table_name='transactions')
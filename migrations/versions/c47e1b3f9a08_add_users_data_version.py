@@ -0,0 +1,26 @@
+"""add users.data_version
+
+Revision ID: c47e1b3f9a08
+Revises: 5d3a9f8b7e42
+Create Date: 2026-10-18 11:02:15.370492
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47e1b3f9a08'
+down_revision = '5d3a9f8b7e42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('data_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('data_version')
@@ -0,0 +1,33 @@
+"""add user_forecast cache table
+
+Revision ID: e8a41c6b2d95
+Revises: c47e1b3f9a08
+Create Date: 2026-10-18 12:41:09.118406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8a41c6b2d95'
+down_revision = 'c47e1b3f9a08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_forecast',
+    sa.Column('user_id', sa.VARCHAR(length=60), nullable=False),
+    sa.Column('data_version', sa.Integer(), nullable=False),
+    sa.Column('computed_for', sa.String(length=7), nullable=False),
+    sa.Column('horizon', sa.Integer(), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('user_forecast')
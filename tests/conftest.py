@@ -0,0 +1,65 @@
+import os
+import tempfile
+import uuid
+
+import pytest
+
+# config.Config reads the environment when it is imported, so this has to come first
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='finance-tests-'), 'test.db')
+os.environ['PASSWORD_HASH_WORKERS'] = '0'
+os.environ['SSE_ENABLED'] = '0'
+
+from flask_migrate import upgrade  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.aggregates import balance_drift, verify_monthly_summary  # noqa: E402
+from app.importer import insert_batch, validate_row  # noqa: E402
+from app.models import Users  # noqa: E402
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with app.app_context():
+        upgrade(directory=MIGRATIONS)
+    return app
+
+
+@pytest.fixture
+def user_id(app):
+    """A fresh user with no transactions."""
+    with app.app_context():
+        user_id = str(uuid.uuid4())
+        db.session.add(Users(id=user_id, username=user_id[:20], first_name='Test', last_name='User',
+                             email=f"{user_id}@example.com", phone='+2348030000000', balance=0,
+                             password_hash='-'))
+        db.session.commit()
+    return user_id
+
+
+@pytest.fixture
+def client(app, user_id):
+    """A test client logged in as user_id."""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = user_id
+        session['_fresh'] = True
+    return client
+
+
+def add_transactions(user_id, *rows):
+    """Insert importer-style rows ({'amount': '10', 'category': 'Bills', ...}) with their balance and rollups.
+
+    Call inside an app context; returns the new transaction ids.
+    """
+    values = [validate_row(row, user_id) for row in rows]
+    insert_batch(db.session.get(Users, user_id), values)
+    return [row['id'] for row in values]
+
+
+def assert_consistent(user_id):
+    """The stored balance and monthly rollups agree with the user's transactions."""
+    assert balance_drift(user_id) == {}
+    assert verify_monthly_summary(user_id) == {}
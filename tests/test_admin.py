@@ -0,0 +1,43 @@
+import re
+import uuid
+
+from app import db
+from app.models import Users
+
+
+def other_user():
+    user_id = str(uuid.uuid4())
+    db.session.add(Users(id=user_id, username=user_id[:20], first_name='Other', last_name='User',
+                         email=f"{user_id}@example.com", phone='+2348030000000', balance=0, password_hash='-'))
+    db.session.commit()
+    return user_id
+
+
+def test_non_admins_cannot_list_or_delete_users(app, client):
+    with app.app_context():
+        victim = other_user()
+
+    assert client.get('/admin/users').status_code == 403
+    assert client.post(f'/delete_user/{victim}').status_code == 403
+    assert app.test_client().post(f'/delete_user/{victim}').status_code in (302, 401)
+    with app.app_context():
+        assert db.session.get(Users, victim) is not None
+
+
+def test_admin_deletes_with_a_csrf_protected_post(app, client, user_id, monkeypatch):
+    monkeypatch.setitem(app.config, 'ADMIN_USERNAMES', {user_id[:20]})
+    monkeypatch.setitem(app.config, 'WTF_CSRF_ENABLED', True)
+    with app.app_context():
+        victim = other_user()
+
+    assert client.get(f'/delete_user/{victim}').status_code == 405
+    assert client.post(f'/delete_user/{victim}').status_code == 400
+    with app.app_context():
+        assert db.session.get(Users, victim) is not None
+
+    page = client.get('/admin/users', query_string={'q': victim[:20]}).get_data(as_text=True)
+    token = re.search(r'name="csrf_token" type="hidden" value="([^"]+)"', page).group(1)
+    response = client.post(f'/delete_user/{victim}', data={'csrf_token': token})
+    assert response.status_code == 302
+    with app.app_context():
+        assert db.session.get(Users, victim) is None
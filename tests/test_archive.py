@@ -0,0 +1,58 @@
+from datetime import date, datetime
+
+from app import db
+from app.aggregates import dashboard_totals
+from app.archive import archive_transactions, MIN_MONTHS
+from app.forecast import compute_forecasts
+from app.models import Users, Transactions, ArchivedTransactions
+from conftest import add_transactions, assert_consistent
+
+
+def months_ago(months, day):
+    month = date.today().year * 12 + date.today().month - 1 - months
+    return datetime(month // 12, month % 12 + 1, day)
+
+
+def test_archiving_a_recurring_rule_keeps_its_projection(app, user_id):
+    with app.app_context():
+        add_transactions(user_id,
+                         {'amount': '1000', 'type': 'Income', 'category': 'Bills', 'frequency': 'Monthly',
+                          'duration': '12', 'date': months_ago(MIN_MONTHS + 1, 20).isoformat()},
+                         {'amount': '40', 'type': 'Expense', 'category': 'Bills',
+                          'date': months_ago(1, 3).isoformat()})
+        user = db.session.get(Users, user_id)
+        before = dashboard_totals(user)
+        before_forecast = compute_forecasts([user])
+        version = user.data_version
+
+        assert archive_transactions(MIN_MONTHS) == 1
+        db.session.expire_all()
+        user = db.session.get(Users, user_id)
+        assert db.session.query(ArchivedTransactions).filter_by(user_id=user_id).count() == 1
+        assert db.session.query(Transactions).filter_by(user_id=user_id).count() == 1
+
+        # Caches keyed on data_version must not serve the pre-archive entries
+        assert user.data_version > version
+        after = dashboard_totals(user)
+        assert (after.income, after.expense, after.projected_balance) == \
+            (before.income, before.expense, before.projected_balance)
+        assert compute_forecasts([user]) == before_forecast
+        assert_consistent(user_id)
+
+
+def test_archived_search_hits_have_no_detail_link(app, client, user_id):
+    with app.app_context():
+        archived_id, live_id = add_transactions(
+            user_id,
+            {'amount': '70', 'type': 'Expense', 'category': 'Bills', 'description': 'Plumber visit',
+             'date': months_ago(MIN_MONTHS + 1, 5).isoformat()},
+            {'amount': '80', 'type': 'Expense', 'category': 'Bills', 'description': 'Plumber again',
+             'date': months_ago(1, 5).isoformat()})
+        archive_transactions(MIN_MONTHS)
+
+    response = client.get('/api/transactions/search', query_string={'q': 'plumber'})
+    assert response.status_code == 200
+    hits = {hit['id']: hit for hit in response.json['transactions']}
+    assert hits[archived_id]['archived'] and 'url' not in hits[archived_id]
+    assert not hits[live_id]['archived']
+    assert client.get(hits[live_id]['url']).status_code == 200
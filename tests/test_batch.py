@@ -0,0 +1,86 @@
+import threading
+
+from app import db
+from app.models import IdempotencyKey
+from conftest import add_transactions, assert_consistent
+
+URL = '/api/transactions:batch'
+
+
+def post(client, *operations):
+    response = client.post(URL, json={'operations': list(operations)})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response.json['results']
+
+
+def test_retries_with_new_keys_do_not_double_apply(app, client, user_id):
+    with app.app_context():
+        transaction_id, = add_transactions(user_id, {'amount': '500', 'type': 'Expense', 'category': 'Bills'})
+
+    first, = post(client, {'op': 'delete', 'key': 'delete-1', 'id': transaction_id})
+    second, = post(client, {'op': 'delete', 'key': 'delete-2', 'id': transaction_id})
+    assert first['status'] == 204
+    assert second['status'] == 404
+    with app.app_context():
+        assert_consistent(user_id)
+
+
+def test_concurrent_batches_keep_balance_consistent(app, user_id):
+    with app.app_context():
+        ids = add_transactions(user_id, *({'amount': str(amount), 'type': 'Income', 'category': 'Bills'}
+                                          for amount in (5, 6, 7)))
+
+    clients = []
+    for _ in range(4):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = user_id
+        clients.append(client)
+    barrier = threading.Barrier(len(clients))
+
+    def worker(number, client):
+        operations = [{'op': 'delete' if number % 2 else 'update', 'key': f"{number}-{transaction_id}",
+                       'id': transaction_id, 'transaction': {'amount': 100 + number}} for transaction_id in ids]
+        barrier.wait()
+        client.post(URL, json={'operations': operations})
+
+    threads = [threading.Thread(target=worker, args=item) for item in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        assert_consistent(user_id)
+
+
+def test_rejected_operations_store_no_key(app, client, user_id):
+    rejected, = post(client, {'op': 'create', 'key': 'fix-me', 'transaction': {'amount': 10, 'category': 'Nope'}})
+    assert rejected['status'] == 400
+    with app.app_context():
+        assert db.session.get(IdempotencyKey, (user_id, 'fix-me')) is None
+
+    # The corrected operation can reuse the key
+    created, = post(client, {'op': 'create', 'key': 'fix-me', 'transaction': {'amount': 10, 'category': 'Bills'}})
+    assert created['status'] == 201
+    replayed, = post(client, {'op': 'create', 'key': 'fix-me', 'transaction': {'amount': 10, 'category': 'Bills'}})
+    assert replayed['replayed'] and replayed['transaction'] == created['transaction']
+    with app.app_context():
+        assert_consistent(user_id)
+
+
+def test_non_finite_and_oversized_amounts_are_per_operation_errors(app, client, user_id):
+    # json.loads turns 1e400 into float('inf') and accepts NaN and Infinity
+    body = ('{"operations": ['
+            '{"op": "create", "key": "a", "transaction": {"amount": 1e400, "category": "Bills"}},'
+            '{"op": "create", "key": "b", "transaction": {"amount": NaN, "category": "Bills"}},'
+            '{"op": "create", "key": "c", "transaction": {"amount": -Infinity, "category": "Bills"}},'
+            '{"op": "create", "key": "d", "transaction": {"amount": 1e30, "category": "Bills"}},'
+            '{"op": "create", "key": "e", "transaction": {"amount": 2147483648, "category": "Bills"}},'
+            '{"op": "create", "key": "f", "transaction": {"amount": 7, "category": "Bills"}}]}')
+    response = client.post(URL, data=body, content_type='application/json')
+    assert response.status_code == 200
+    assert [result['status'] for result in response.json['results']] == [400, 400, 400, 400, 400, 201]
+    assert response.json['balance'] == 7
+    with app.app_context():
+        assert_consistent(user_id)
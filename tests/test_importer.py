@@ -0,0 +1,36 @@
+import io
+
+import pytest
+
+from app import db
+from app.importer import validate_row, import_transactions, parse_statement, MAX_AMOUNT
+from app.models import Users
+from conftest import assert_consistent
+
+
+@pytest.mark.parametrize('amount', ['inf', '-inf', 'NaN', 'sNaN', '1e30', '1e999999', str(MAX_AMOUNT + 1),
+                                    'abc', '0'])
+def test_invalid_amounts_are_rejected(amount):
+    with pytest.raises(ValueError):
+        validate_row({'amount': amount, 'category': 'Bills'}, 'user')
+
+
+def test_largest_amount_fits():
+    assert validate_row({'amount': str(MAX_AMOUNT), 'category': 'Bills'}, 'user')['amount'] == MAX_AMOUNT
+
+
+def test_bad_amounts_are_reported_without_aborting_the_import(app, user_id):
+    statement = (b"amount,type,category\n10,Income,Bills\ninf,Income,Bills\n1e30,Expense,Bills\n"
+                 b"NaN,,Bills\n5,Expense,Bills\n")
+    with app.app_context():
+        user = db.session.get(Users, user_id)
+        result = import_transactions(user, parse_statement(io.BytesIO(statement), 'statement.csv'), batch_size=1)
+        assert result.inserted == 2
+        assert [line for line, _ in result.errors] == [3, 4, 5]
+        assert db.session.get(Users, user_id).balance == 5
+        assert_consistent(user_id)
+
+
+def test_dates_with_offsets_are_stored_naive():
+    assert validate_row({'amount': '1', 'category': 'Bills', 'date': '2026-03-01T12:00:00+02:00'},
+                        'user')['date_added'].tzinfo is None
@@ -0,0 +1,24 @@
+from app import instrumentation
+from app.instrumentation import Metrics
+
+
+def test_nested_renders_count_once(app, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(instrumentation.time, 'perf_counter', lambda: now[0])
+    metrics = Metrics()
+
+    def render(start, end, fragments=()):
+        now[0] = start
+        metrics._before_render_template(app, None, {})
+        for fragment in fragments:
+            render(*fragment)
+        now[0] = end
+        metrics._template_rendered(app, None, {})
+
+    with app.test_request_context():
+        metrics._request_started(app)
+        # A page rendering two fragments, then an unrelated top-level render
+        render(1.0, 5.0, fragments=[(2.0, 3.0), (3.0, 4.5)])
+        render(6.0, 8.0)
+        stats = instrumentation.g._request_stats
+    assert stats.template_time == 6.0
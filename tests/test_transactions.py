@@ -0,0 +1,71 @@
+import threading
+from types import SimpleNamespace
+
+from app import db
+from app.models import Users, Transactions
+from conftest import add_transactions, assert_consistent
+
+
+def form(**fields):
+    values = dict(dict(amount=10, trans_type='Expense', transaction_frequency='Once', duration=0,
+                       category='Bills', description=None), **fields)
+    return SimpleNamespace(**{name: SimpleNamespace(data=value) for name, value in values.items()})
+
+
+def test_repeated_delete_applies_deltas_once(app, user_id):
+    with app.app_context():
+        _, twice = add_transactions(user_id, {'amount': '256', 'type': 'Income', 'category': 'Bills'},
+                                       {'amount': '2186', 'type': 'Expense', 'category': 'Bills'})
+        transaction = db.session.get(Transactions, twice)
+        assert Transactions.delete_transaction(transaction)
+        # A second click on the same link, holding the same stale object
+        assert not Transactions.delete_transaction(transaction)
+        assert db.session.get(Users, user_id).balance == 256
+        assert_consistent(user_id)
+
+
+def test_update_refused_when_row_changed_since_loaded(app, user_id):
+    with app.app_context():
+        transaction_id, = add_transactions(user_id, {'amount': '100', 'type': 'Expense', 'category': 'Bills'})
+        stale = db.session.get(Transactions, transaction_id)
+        with app.app_context():
+            Transactions.update_transaction(db.session.get(Transactions, transaction_id), form(amount=300))
+
+        # Loaded before the other edit committed, so its deltas would be computed from 100
+        assert not stale.update_if_unchanged({'amount': 50}, rollup=SimpleNamespace(add=None))
+        db.session.rollback()
+        assert db.session.get(Users, user_id).balance == -300
+        assert_consistent(user_id)
+
+
+def test_concurrent_deletes_and_edits_keep_balance_consistent(app, user_id):
+    with app.app_context():
+        ids = add_transactions(user_id, *({'amount': str(amount), 'type': 'Expense', 'category': 'Bills'}
+                                          for amount in (10, 20, 30)))
+
+    barrier = threading.Barrier(6)
+    errors = []
+
+    def worker(transaction_id, edit):
+        with app.app_context():
+            transaction = db.session.get(Transactions, transaction_id)
+            barrier.wait()
+            try:
+                if edit:
+                    Transactions.update_transaction(transaction, form(amount=999))
+                else:
+                    Transactions.delete_transaction(transaction)
+            except Exception as e:
+                # SQLite may refuse one of two simultaneous writers outright; that must not drift either
+                db.session.rollback()
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(transaction_id, edit))
+               for transaction_id in ids for edit in (False, True)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        assert_consistent(user_id)